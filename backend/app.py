@@ -9,11 +9,25 @@ import tempfile
 import time
 import logging
 import json
-from threading import Thread
+import gzip
+import hashlib
+import math
+import importlib
+import select
+import socket
+import concurrent.futures
+from threading import Thread, Lock
 from werkzeug.utils import secure_filename
 from functools import wraps
 from pydub import AudioSegment
 import re # Import re for secure filename generation
+from scheduler import SynthesisScheduler, SchedulerRejected, RequestCancelled, INTERACTIVE, BULK
+from usage import UsageLedger, QuotaExceeded, SOURCE_CACHE, SOURCE_UPSTREAM, key_id as usage_key_id
+
+try:
+    import brotli # Optional: preferred over gzip for bootstrap responses when available
+except ImportError:
+    brotli = None
 
 # ----------------------------------------------------
 # Configuration
@@ -33,10 +47,61 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 AUDIO_DIR = os.path.join(tempfile.gettempdir(), 'edge_tts_audio')
-PRESETS_DIR = os.path.join(os.path.dirname(__file__), 'presets')
+PRESETS_DIR = os.environ.get('PRESETS_DIR', os.path.join(os.path.dirname(__file__), 'presets'))
 MAX_TEXT_LENGTH = 50000
 CLEANUP_INTERVAL = 3600  # 1 hour
 MAX_FILE_AGE = 3600      # 1 hour
+VOICE_CACHE_TTL = 3600   # Voice catalogs rarely change; cache them for 1 hour
+VOICE_CACHE_MAX_ENTRIES = 128 # One entry per Edge catalog / Azure (region, key); oldest evicted first
+
+# Accepted synthesis parameter ranges (also reported to the frontends by the bootstrap endpoints)
+EDGE_PARAM_RANGES = {'rate': (-100, 200), 'volume': (-100, 100), 'pitch': (-50, 50)}
+AZURE_PARAM_RANGES = {'rate': (-100, 200), 'pitch': (-100, 100), 'volume': (-100, 100)}
+EDGE_OUTPUT_FORMATS = ['mp3', 'wav']
+
+# Preset filename prefixes, fields and their defaults, per engine
+EDGE_PRESET_PREFIX = "edge_"
+AZURE_PRESET_PREFIX = "azure_"
+EDGE_PRESET_FIELDS = {"voice": "", "rate": 0, "volume": 0, "pitch": 0}
+AZURE_PRESET_FIELDS = {"voice": "", "style": "general", "rate": 0, "pitch": 0, "volume": 0}
+HOST = os.environ.get('HOST', '127.0.0.1')
+PORT = int(os.environ.get('PORT', 5000))
+SYNTH_RATE_LIMIT = int(os.environ.get('SYNTH_RATE_LIMIT', 5))    # Synthesis requests per minute, per priority class
+VOICES_RATE_LIMIT = int(os.environ.get('VOICES_RATE_LIMIT', 10)) # Voice list requests per minute
+
+# Synthesis scheduling: short texts run as "interactive", long ones as "bulk".
+# Bulk work may never occupy every slot, so interactive requests always have capacity
+# (except with MAX_CONCURRENT_SYNTH=1, where bulk and interactive share the single slot).
+MAX_CONCURRENT_SYNTH = int(os.environ.get('MAX_CONCURRENT_SYNTH', 4))
+BULK_MAX_CONCURRENT = int(os.environ.get('BULK_MAX_CONCURRENT', max(1, MAX_CONCURRENT_SYNTH - 1)))
+INTERACTIVE_MAX_CHARS = int(os.environ.get('INTERACTIVE_MAX_CHARS', 500))
+MAX_SYNTH_QUEUE = int(os.environ.get('MAX_SYNTH_QUEUE', 32))
+SYNTH_DEADLINES = {      # Default (and maximum) seconds a request may take, queueing included
+    INTERACTIVE: float(os.environ.get('INTERACTIVE_DEADLINE', 30)),
+    BULK: float(os.environ.get('BULK_DEADLINE', 180)),
+}
+# Each class has its own per-minute budget, so bulk submissions can't use up the interactive one
+SYNTH_RATE_LIMITS = {
+    INTERACTIVE: int(os.environ.get('INTERACTIVE_SYNTH_RATE_LIMIT', SYNTH_RATE_LIMIT)),
+    BULK: int(os.environ.get('BULK_SYNTH_RATE_LIMIT', SYNTH_RATE_LIMIT)),
+}
+CANCEL_POLL_INTERVAL = 0.25  # How often running work checks for client disconnects
+
+# Azure usage accounting. Quotas are billed characters per key per calendar month (0 = no limit);
+# per-key overrides go in QUOTA_FILE as {"<keyId>": {"soft": ..., "hard": ...}}
+USAGE_DB = os.environ.get('USAGE_DB', os.path.join(os.path.dirname(__file__), 'usage.db'))
+QUOTA_FILE = os.environ.get('QUOTA_FILE', os.path.join(os.path.dirname(__file__), 'quotas.json'))
+AZURE_QUOTA_SOFT_CHARS = int(os.environ.get('AZURE_QUOTA_SOFT_CHARS', 0))
+AZURE_QUOTA_HARD_CHARS = int(os.environ.get('AZURE_QUOTA_HARD_CHARS', 0))
+USAGE_RAW_RETENTION_DAYS = int(os.environ.get('USAGE_RAW_RETENTION_DAYS', 7))
+AZURE_OUTPUT_FORMAT = 'audio-24khz-48kbitrate-mono-mp3' # Common high-quality format
+AZURE_OUTPUT_BITRATE = 48000 # bits/s of AZURE_OUTPUT_FORMAT, used to derive audio duration
+
+# Upstream endpoints. Override these to point the app at a local stand-in
+# (see benchmarks/mock_upstream.py) instead of Microsoft's services.
+AZURE_TTS_ENDPOINT = os.environ.get('AZURE_TTS_ENDPOINT', 'https://{region}.tts.speech.microsoft.com')
+EDGE_TTS_WSS_URL = os.environ.get('EDGE_TTS_WSS_URL')
+EDGE_TTS_VOICE_LIST_URL = os.environ.get('EDGE_TTS_VOICE_LIST_URL')
 
 # Ensure directories exist
 os.makedirs(AUDIO_DIR, exist_ok=True)
@@ -46,6 +111,27 @@ os.makedirs(PRESETS_DIR, exist_ok=True)
 loop = asyncio.new_event_loop()
 asyncio.set_event_loop(loop)
 
+scheduler = SynthesisScheduler(
+    max_concurrent=MAX_CONCURRENT_SYNTH,
+    bulk_max_concurrent=BULK_MAX_CONCURRENT,
+    interactive_max_chars=INTERACTIVE_MAX_CHARS,
+    max_queue=MAX_SYNTH_QUEUE,
+)
+
+usage_ledger = UsageLedger(
+    USAGE_DB,
+    soft_limit=AZURE_QUOTA_SOFT_CHARS,
+    hard_limit=AZURE_QUOTA_HARD_CHARS,
+    quota_file=QUOTA_FILE,
+    raw_retention_days=USAGE_RAW_RETENTION_DAYS,
+)
+
+# edge-tts reads its endpoints from module globals at call time
+if EDGE_TTS_WSS_URL:
+    importlib.import_module('edge_tts.communicate').WSS_URL = EDGE_TTS_WSS_URL
+if EDGE_TTS_VOICE_LIST_URL:
+    importlib.import_module('edge_tts.list_voices').VOICE_LIST = EDGE_TTS_VOICE_LIST_URL
+
 # ----------------------------------------------------
 # Helper Functions
 # ----------------------------------------------------
@@ -61,6 +147,10 @@ def secure_preset_filename(name, prefix=""):
         safe_name = "default"
     return f"{prefix}{safe_name}.json"
 
+def azure_endpoint(region):
+    """Returns the Azure TTS base URL for a region (no trailing slash)."""
+    return AZURE_TTS_ENDPOINT.format(region=region).rstrip('/')
+
 def validate_audio_filename(filename):
     """Validates audio filename for security."""
     # Use Werkzeug's secure_filename which is quite restrictive
@@ -90,35 +180,215 @@ def cleanup_old_files():
     except Exception as e:
         logger.error(f"Error during cleanup process: {str(e)}")
 
-def run_async(coro):
-    """Helper function to run coroutines in the event loop from a sync context."""
+def run_async(coro, timeout=60, is_cancelled=None):
+    """Helper function to run coroutines in the event loop from a sync context.
+
+    The coroutine is cancelled if it outlives `timeout` or `is_cancelled()` turns true.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    deadline = time.monotonic() + timeout
     try:
-        future = asyncio.run_coroutine_threadsafe(coro, loop)
-        return future.result(timeout=60) # Add a timeout
-    except TimeoutError:
-        logger.error("Async operation timed out.")
-        raise TimeoutError("语音生成或获取超时")
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                future.cancel()
+                logger.error("Async operation timed out.")
+                raise TimeoutError("语音生成或获取超时")
+            try:
+                return future.result(timeout=min(CANCEL_POLL_INTERVAL, remaining))
+            except concurrent.futures.TimeoutError:
+                if is_cancelled is not None and is_cancelled():
+                    future.cancel()
+                    logger.info("Client disconnected, cancelled async operation.")
+                    raise RequestCancelled("客户端已断开连接")
+    except (TimeoutError, RequestCancelled):
+        raise
     except Exception as e:
         logger.error(f"Error in run_async: {str(e)}", exc_info=True)
         raise # Re-raise the original exception
 
+def client_disconnect_checker():
+    """Returns a callable that reports whether the current HTTP client has gone away."""
+    sock = request.environ.get('werkzeug.socket')
+    if sock is None:
+        return lambda: False # Not running under Werkzeug; can't tell
+    def is_disconnected():
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            # The request body was already consumed, so a readable socket with no data is EOF
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+        except ValueError:
+            return False # e.g. TLS sockets don't support MSG_PEEK
+        except OSError:
+            return True
+    return is_disconnected
+
+def synthesis_deadline(data, priority):
+    """Seconds the request may take. Clients may ask for a shorter deadline, never a longer one."""
+    default = SYNTH_DEADLINES[priority]
+    requested = data.get('deadline')
+    if requested is None:
+        return default
+    requested = float(requested)
+    if not math.isfinite(requested) or requested <= 0:
+        raise ValueError("Deadline must be a positive number")
+    return min(requested, default)
+
+def scheduler_rejected_response(e):
+    """503 response telling the client when to retry."""
+    response = jsonify({"error": f"{e}（约 {e.retry_after} 秒后重试）", "retryAfter": e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+def take_rate_slot(calls, max_per_minute):
+    """Records a call in `calls` unless `max_per_minute` calls were made in the last minute."""
+    now = time.time()
+    # Remove calls older than 1 minute
+    calls[:] = [call for call in calls if now - call < 60]
+    if len(calls) >= max_per_minute:
+        return False
+    calls.append(now)
+    return True
+
 def rate_limit(max_per_minute):
     """Rate limiting decorator."""
     def decorator(f):
         calls = []
         @wraps(f)
         def wrapper(*args, **kwargs):
-            now = time.time()
-            # Remove calls older than 1 minute
-            calls[:] = [call for call in calls if now - call < 60]
-            if len(calls) >= max_per_minute:
+            if not take_rate_slot(calls, max_per_minute):
                 logger.warning(f"Rate limit exceeded for endpoint: {request.path}")
                 return jsonify({"error": "请求过于频繁，请稍后再试"}), 429
-            calls.append(now)
             return f(*args, **kwargs)
         return wrapper
     return decorator
 
+def synthesis_rate_limit(limits):
+    """Rate limiting decorator for synthesis routes, with a separate budget per priority class."""
+    def decorator(f):
+        calls = {priority: [] for priority in limits}
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # Classify the same way the route does (the parsed body is cached by Flask)
+            data = request.get_json(silent=True)
+            data = data if isinstance(data, dict) else {}
+            text = data.get('text')
+            priority = scheduler.classify(len(text.strip()) if isinstance(text, str) else 0, data.get('priority'))
+            if not take_rate_slot(calls[priority], limits[priority]):
+                logger.warning(f"Rate limit exceeded for {priority} requests on endpoint: {request.path}")
+                return jsonify({"error": "请求过于频繁，请稍后再试"}), 429
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def load_presets(prefix, fields):
+    """Reads every preset with the given filename prefix, including its full parameters."""
+    presets = []
+    logger.debug(f"Listing presets with prefix '{prefix}' from: {PRESETS_DIR}")
+    for filename in os.listdir(PRESETS_DIR):
+        if filename.startswith(prefix) and filename.endswith('.json'):
+            filepath = os.path.join(PRESETS_DIR, filename)
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    preset = json.load(f)
+                entry = {"name": filename[len(prefix):-5]} # Extract name
+                entry.update({field: preset.get(field, default) for field, default in fields.items()})
+                presets.append(entry)
+            except Exception as e:
+                logger.error(f"Error reading preset file {filename}: {e}")
+    presets.sort(key=lambda x: x['name']) # Sort alphabetically
+    return presets
+
+class VoiceFetchRateLimited(Exception):
+    """Raised when fetching a voice catalog upstream would exceed VOICES_RATE_LIMIT."""
+
+_voice_cache = {}
+_voice_cache_lock = Lock()
+# Upstream voice list fetches from every route (manual refresh and bootstrap cache misses)
+# share one budget, so bootstrap can't be used to get around the voice list rate limit
+_voice_fetch_calls = []
+
+def cached_voices(cache_key, fetch, refresh=False):
+    """
+    Returns fetch() result, reusing it for VOICE_CACHE_TTL seconds per cache_key.
+    `refresh` skips the cached entry (but still updates it).
+    """
+    now = time.time()
+    with _voice_cache_lock:
+        entry = _voice_cache.get(cache_key)
+        if entry and not refresh and now - entry[0] < VOICE_CACHE_TTL:
+            return entry[1]
+        if not take_rate_slot(_voice_fetch_calls, VOICES_RATE_LIMIT):
+            logger.warning(f"Voice list fetch rate limit exceeded for: {cache_key[0]}")
+            raise VoiceFetchRateLimited("请求过于频繁，请稍后再试")
+    voices = fetch()
+    with _voice_cache_lock:
+        _voice_cache[cache_key] = (now, voices)
+        # Drop expired entries, then the oldest ones, so the cache can't grow with every new key
+        for key in [k for k, (fetched_at, _) in _voice_cache.items() if now - fetched_at >= VOICE_CACHE_TTL]:
+            del _voice_cache[key]
+        while len(_voice_cache) > VOICE_CACHE_MAX_ENTRIES:
+            del _voice_cache[min(_voice_cache, key=lambda k: _voice_cache[k][0])]
+    return voices
+
+def get_edge_voice_catalog(refresh=False):
+    """Edge voices split into Chinese (for prioritization in the frontend) and other voices."""
+    def fetch():
+        voices = run_async(edge_tts.list_voices())
+        logger.info(f"Successfully retrieved {len(voices)} Edge voices.")
+        return {
+            "chinese_voices": sorted([v for v in voices if v['Locale'].startswith('zh-')], key=lambda x: x['ShortName']),
+            "other_voices": sorted([v for v in voices if not v['Locale'].startswith('zh-')], key=lambda x: x['Locale'])
+        }
+    return cached_voices(('edge',), fetch, refresh)
+
+def get_azure_voice_catalog(region, api_key, refresh=False):
+    """Azure voices for a region, sorted by locale then name. Raises requests exceptions."""
+    def fetch():
+        url = f"{azure_endpoint(region)}/cognitiveservices/voices/list"
+        logger.info(f"Fetching Azure voices from region: {region}")
+        response = requests.get(url, headers={'Ocp-Apim-Subscription-Key': api_key}, timeout=15) # Add timeout
+        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+        voices = response.json()
+        logger.info(f"Successfully retrieved {len(voices)} Azure voices from region {region}.")
+        voices.sort(key=lambda x: (x['Locale'], x['ShortName']))
+        return voices
+    # Cache per key as well as region: a bad key must not be served another key's catalog
+    return cached_voices(('azure', region, usage_key_id(api_key)), fetch, refresh)
+
+def server_limits(param_ranges, formats):
+    """Limits the frontends need to validate input before submitting it."""
+    return {
+        "maxTextLength": MAX_TEXT_LENGTH,
+        "interactiveMaxChars": INTERACTIVE_MAX_CHARS,
+        "deadlines": SYNTH_DEADLINES,
+        "paramRanges": {name: list(bounds) for name, bounds in param_ranges.items()},
+        "formats": formats,
+    }
+
+def cached_json_response(payload, vary=()):
+    """
+    JSON response with a weak ETag (304 on If-None-Match) and brotli/gzip compression.
+    Clients must revalidate, so changed presets show up on the next page load.
+    """
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        encoding = None
+        if brotli is not None and 'br' in request.accept_encodings:
+            body, encoding = brotli.compress(body, quality=5), 'br'
+        elif 'gzip' in request.accept_encodings:
+            body, encoding = gzip.compress(body, compresslevel=6), 'gzip'
+        response = app.response_class(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag, weak=True) # Same ETag for every encoding of the same payload
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = ', '.join(('Accept-Encoding',) + tuple(vary))
+    return response
+
 # ----------------------------------------------------
 # Frontend Routes
 # ----------------------------------------------------
@@ -148,26 +418,43 @@ def serve_js(filename):
 # Edge TTS API Routes
 # ----------------------------------------------------
 @app.route('/api/edge/voices', methods=['GET'])
-@rate_limit(10)
+@rate_limit(VOICES_RATE_LIMIT)
 def get_edge_voices():
-    """Gets the list of available Edge TTS voices."""
+    """Gets the list of available Edge TTS voices. Always fetched fresh (and re-cached for bootstrap)."""
     logger.info("Request received for Edge TTS voices")
     try:
-        voices = run_async(edge_tts.list_voices())
-        # Separate Chinese voices for potential prioritization in frontend
-        chinese_voices = sorted([v for v in voices if v['Locale'].startswith('zh-')], key=lambda x: x['ShortName'])
-        other_voices = sorted([v for v in voices if not v['Locale'].startswith('zh-')], key=lambda x: x['Locale'])
-        logger.info(f"Successfully retrieved {len(voices)} Edge voices.")
-        return jsonify({
-            "chinese_voices": chinese_voices,
-            "other_voices": other_voices
-        })
+        return jsonify(get_edge_voice_catalog(refresh=True))
+    except VoiceFetchRateLimited as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         logger.error(f"Error getting Edge voices: {str(e)}", exc_info=True)
         return jsonify({"error": f"获取 Edge 语音列表失败: {str(e)}"}), 500
 
+@app.route('/api/edge/bootstrap', methods=['GET'])
+def edge_bootstrap():
+    """Voice catalog, presets with full parameters and server limits for the Edge page, in one response."""
+    logger.info("Request received for Edge bootstrap")
+    try:
+        voices, voices_error = None, None
+        try:
+            voices = get_edge_voice_catalog()
+        except VoiceFetchRateLimited as e:
+            voices_error = str(e)
+        except Exception as e: # Still return presets and limits so the page can start
+            logger.error(f"Error getting Edge voices for bootstrap: {str(e)}", exc_info=True)
+            voices_error = f"获取 Edge 语音列表失败: {str(e)}"
+        return cached_json_response({
+            "voices": voices,
+            "voicesError": voices_error,
+            "presets": load_presets(EDGE_PRESET_PREFIX, EDGE_PRESET_FIELDS),
+            "limits": server_limits(EDGE_PARAM_RANGES, EDGE_OUTPUT_FORMATS),
+        })
+    except Exception as e:
+        logger.error(f"Unexpected error in /api/edge/bootstrap: {str(e)}", exc_info=True)
+        return jsonify({"error": "获取页面初始化数据失败"}), 500
+
 @app.route('/api/edge/synthesize', methods=['POST'])
-@rate_limit(5) # Limit synthesis requests
+@synthesis_rate_limit(SYNTH_RATE_LIMITS) # Limit synthesis requests per priority class
 def edge_synthesize():
     """Synthesizes text using Edge TTS."""
     logger.info("Request received for Edge TTS synthesis")
@@ -183,25 +470,27 @@ def edge_synthesize():
         rate = data.get('rate', 0)
         volume = data.get('volume', 0)
         pitch = data.get('pitch', 0)
+        priority = scheduler.classify(len(text), data.get('priority'))
 
         # Input validation
         if not text:
             return jsonify({"error": "合成文本不能为空"}), 400
         if len(text) > MAX_TEXT_LENGTH:
             return jsonify({"error": f"文本过长，最大允许 {MAX_TEXT_LENGTH} 字符"}), 413 # Payload Too Large
-        if output_format not in ['mp3', 'wav']:
+        if output_format not in EDGE_OUTPUT_FORMATS:
             return jsonify({"error": "无效的输出格式，请选择 mp3 或 wav"}), 400
 
         try:
             rate = int(rate)
             volume = int(volume)
             pitch = int(pitch)
-            if not (-100 <= rate <= 200): # EdgeTTS supports wider range? Let's use a safe common range first
+            if not (EDGE_PARAM_RANGES['rate'][0] <= rate <= EDGE_PARAM_RANGES['rate'][1]):
                  raise ValueError("Rate out of range")
-            if not (-100 <= volume <= 100): # EdgeTTS range
+            if not (EDGE_PARAM_RANGES['volume'][0] <= volume <= EDGE_PARAM_RANGES['volume'][1]):
                  raise ValueError("Volume out of range")
-            if not (-50 <= pitch <= 50): # Pitch range for pydub manipulation
+            if not (EDGE_PARAM_RANGES['pitch'][0] <= pitch <= EDGE_PARAM_RANGES['pitch'][1]): # Pitch range for pydub manipulation
                  raise ValueError("Pitch out of range")
+            deadline = synthesis_deadline(data, priority)
         except (TypeError, ValueError) as e:
              logger.warning(f"Invalid parameter type for Edge synthesis: {e}")
              return jsonify({"error": f"无效的语音参数: {e}"}), 400
@@ -221,10 +510,9 @@ def edge_synthesize():
         temp_mp3_file = validate_audio_filename(f"temp_{file_id}.mp3")
         final_output_file = validate_audio_filename(f"{file_id}.{output_format}")
 
-        logger.info(f"Edge Synthesis Params: Voice={voice}, Rate={rate_str}, Volume={volume_str}, Pitch={pitch}, Format={output_format}")
+        logger.info(f"Edge Synthesis Params: Voice={voice}, Rate={rate_str}, Volume={volume_str}, Pitch={pitch}, Format={output_format}, Priority={priority}")
 
         async def generate_edge_speech():
-            nonlocal final_output_file # Ensure we can modify the outer var if pitch changes format
             try:
                 # Step 1: Generate base audio using edge-tts (without pitch)
                 communicate = edge_tts.Communicate(
@@ -237,32 +525,37 @@ def edge_synthesize():
                 await communicate.save(temp_mp3_file)
                 logger.info(f"Saved temporary edge-tts file: {temp_mp3_file}")
 
-                # Step 2: Apply pitch shift using pydub if necessary
-                if pitch != 0:
-                    logger.info(f"Applying pitch shift: {pitch} semitones")
-                    audio = AudioSegment.from_file(temp_mp3_file, format="mp3")
-                    # Pydub pitch shift is based on semitones, not Hz directly.
-                    # Map the -50 to +50 range to roughly -6 to +6 semitones (adjust as needed)
-                    semitones = (pitch / 50.0) * 6.0
-                    new_sample_rate = int(audio.frame_rate * (2.0 ** (semitones / 12.0)))
-                    pitched_audio = audio._spawn(audio.raw_data, overrides={'frame_rate': new_sample_rate})
-                    # Resample back to original rate to maintain duration
-                    pitched_audio = pitched_audio.set_frame_rate(audio.frame_rate)
-                    logger.info(f"Exporting pitched audio to {final_output_file} in format {output_format}")
-                    pitched_audio.export(final_output_file, format=output_format)
-                else:
-                    # If no pitch shift, and format is mp3, just rename
-                    if output_format == 'mp3':
-                        logger.info(f"Renaming temp file to {final_output_file}")
-                        os.rename(temp_mp3_file, final_output_file)
-                    # If no pitch shift, but format is wav, convert
+                # Step 2: Post-process with pydub off the event loop, so CPU-bound
+                # work doesn't stall other requests' websocket streams
+                def postprocess():
+                    if pitch != 0:
+                        logger.info(f"Applying pitch shift: {pitch} semitones")
+                        audio = AudioSegment.from_file(temp_mp3_file, format="mp3")
+                        # Pydub pitch shift is based on semitones, not Hz directly.
+                        # Map the -50 to +50 range to roughly -6 to +6 semitones (adjust as needed)
+                        semitones = (pitch / 50.0) * 6.0
+                        new_sample_rate = int(audio.frame_rate * (2.0 ** (semitones / 12.0)))
+                        pitched_audio = audio._spawn(audio.raw_data, overrides={'frame_rate': new_sample_rate})
+                        # Resample back to original rate to maintain duration
+                        pitched_audio = pitched_audio.set_frame_rate(audio.frame_rate)
+                        logger.info(f"Exporting pitched audio to {final_output_file} in format {output_format}")
+                        pitched_audio.export(final_output_file, format=output_format)
                     else:
-                         logger.info(f"Converting temp MP3 to WAV: {final_output_file}")
-                         audio = AudioSegment.from_file(temp_mp3_file, format="mp3")
-                         audio.export(final_output_file, format="wav")
-                         final_output_file = validate_audio_filename(f"{file_id}.wav") # Update filename if converted
-
+                        # If no pitch shift, and format is mp3, just rename
+                        if output_format == 'mp3':
+                            logger.info(f"Renaming temp file to {final_output_file}")
+                            os.rename(temp_mp3_file, final_output_file)
+                        # If no pitch shift, but format is wav, convert
+                        else:
+                             logger.info(f"Converting temp MP3 to WAV: {final_output_file}")
+                             audio = AudioSegment.from_file(temp_mp3_file, format="mp3")
+                             audio.export(final_output_file, format="wav")
+
+                await asyncio.get_running_loop().run_in_executor(None, postprocess)
                 return final_output_file
+            except asyncio.CancelledError:
+                logger.info("Edge speech generation cancelled.")
+                raise
             except Exception as e:
                 logger.error(f"Error during async speech generation: {str(e)}", exc_info=True)
                 raise # Propagate error
@@ -275,15 +568,26 @@ def edge_synthesize():
                     except OSError as e:
                         logger.error(f"Error removing temp file {temp_mp3_file}: {e}")
 
-        # Run the async generation
+        # Run the async generation once the scheduler grants a slot
+        is_cancelled = client_disconnect_checker()
         try:
-            generated_file_path = run_async(generate_edge_speech())
+            with scheduler.slot(len(text), priority, deadline, is_cancelled) as ticket:
+                generated_file_path = run_async(generate_edge_speech(), timeout=ticket.remaining(),
+                                                is_cancelled=is_cancelled)
             generated_filename = os.path.basename(generated_file_path)
             logger.info(f"Successfully generated Edge TTS audio: {generated_filename}")
             return jsonify({
                 "audioUrl": f"/api/audio/{generated_filename}", # Use the actual final filename
                 "format": output_format
             })
+        except SchedulerRejected as e:
+            return scheduler_rejected_response(e)
+        except RequestCancelled:
+            logger.info("Edge synthesis abandoned: client disconnected")
+            return jsonify({"error": "客户端已断开连接"}), 499
+        except TimeoutError:
+            logger.error("Edge synthesis exceeded its deadline")
+            return jsonify({"error": "语音生成超时，请缩短文本后重试"}), 504
         except Exception as e:
             logger.error(f"Edge synthesis failed: {str(e)}", exc_info=True)
             return jsonify({"error": f"语音合成失败: {str(e)}"}), 500
@@ -297,9 +601,9 @@ def edge_synthesize():
 # Azure TTS API Routes
 # ----------------------------------------------------
 @app.route('/api/azure/voices', methods=['GET'])
-@rate_limit(10)
+@rate_limit(VOICES_RATE_LIMIT)
 def get_azure_voices():
-    """Gets the list of available Azure TTS voices for a specific region."""
+    """Gets the list of available Azure TTS voices for a specific region. Always fetched fresh."""
     logger.info("Request received for Azure TTS voices")
     region = request.args.get('region', 'eastus') # Default region
     api_key = request.headers.get('Ocp-Apim-Subscription-Key')
@@ -308,20 +612,10 @@ def get_azure_voices():
         logger.warning("Azure API key missing in request headers")
         return jsonify({"error": "请求头中缺少 Azure API 密钥 (Ocp-Apim-Subscription-Key)"}), 400
 
-    url = f"https://{region}.tts.speech.microsoft.com/cognitiveservices/voices/list"
-    headers = {'Ocp-Apim-Subscription-Key': api_key}
-
     try:
-        logger.info(f"Fetching Azure voices from region: {region}")
-        response = requests.get(url, headers=headers, timeout=15) # Add timeout
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-        voices = response.json()
-        logger.info(f"Successfully retrieved {len(voices)} Azure voices from region {region}.")
-        # Sort voices maybe by locale then name
-        voices.sort(key=lambda x: (x['Locale'], x['ShortName']))
-        return jsonify(voices)
-
+        return jsonify(get_azure_voice_catalog(region, api_key, refresh=True))
+    except VoiceFetchRateLimited as e:
+        return jsonify({"error": str(e)}), 429
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching Azure voices: {str(e)}", exc_info=True)
         status_code = e.response.status_code if e.response is not None else 500
@@ -335,8 +629,39 @@ def get_azure_voices():
         logger.error(f"Unexpected error getting Azure voices: {str(e)}", exc_info=True)
         return jsonify({"error": "获取 Azure 语音列表时发生意外错误"}), 500
 
+@app.route('/api/azure/bootstrap', methods=['GET'])
+def azure_bootstrap():
+    """
+    Presets with full parameters and server limits for the Azure page, plus the voice
+    catalog for `region` when an API key is supplied, in one response.
+    """
+    logger.info("Request received for Azure bootstrap")
+    region = request.args.get('region', 'eastus') # Default region
+    api_key = request.headers.get('Ocp-Apim-Subscription-Key')
+    try:
+        voices, voices_error = None, None
+        if api_key:
+            try:
+                voices = get_azure_voice_catalog(region, api_key)
+            except VoiceFetchRateLimited as e:
+                voices_error = str(e)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error fetching Azure voices for bootstrap: {str(e)}", exc_info=True)
+                status_code = e.response.status_code if e.response is not None else 500
+                voices_error = f"无法连接或请求 Azure 语音列表失败 ({status_code})"
+        return cached_json_response({
+            "region": region,
+            "voices": voices,
+            "voicesError": voices_error,
+            "presets": load_presets(AZURE_PRESET_PREFIX, AZURE_PRESET_FIELDS),
+            "limits": server_limits(AZURE_PARAM_RANGES, ['mp3']),
+        }, vary=('Ocp-Apim-Subscription-Key',))
+    except Exception as e:
+        logger.error(f"Unexpected error in /api/azure/bootstrap: {str(e)}", exc_info=True)
+        return jsonify({"error": "获取页面初始化数据失败"}), 500
+
 @app.route('/api/azure/synthesize', methods=['POST'])
-@rate_limit(5) # Limit synthesis requests
+@synthesis_rate_limit(SYNTH_RATE_LIMITS) # Limit synthesis requests per priority class
 def azure_synthesize():
     """Synthesizes text using Azure TTS."""
     logger.info("Request received for Azure TTS synthesis")
@@ -358,6 +683,7 @@ def azure_synthesize():
         rate = data.get('rate', 0)
         pitch = data.get('pitch', 0)
         volume = data.get('volume', 0)
+        priority = scheduler.classify(len(text), data.get('priority'))
 
         # Infer locale from voice name (e.g., "zh-CN-XiaoxiaoNeural" -> "zh-CN")
         locale_match = re.match(r"([a-z]{2}-[A-Z]{2})-", voice)
@@ -374,17 +700,18 @@ def azure_synthesize():
              volume = int(volume)
              # Validate Azure ranges based on documentation (can be % or absolute)
              # Let's assume % for now matching our UI sliders
-             if not (-100 <= rate <= 200): # Example range, check Azure docs
+             if not (AZURE_PARAM_RANGES['rate'][0] <= rate <= AZURE_PARAM_RANGES['rate'][1]):
                  raise ValueError("Rate out of range")
-             if not (-100 <= pitch <= 100): # Example range
+             if not (AZURE_PARAM_RANGES['pitch'][0] <= pitch <= AZURE_PARAM_RANGES['pitch'][1]):
                  raise ValueError("Pitch out of range")
-             if not (-100 <= volume <= 100): # Example range
+             if not (AZURE_PARAM_RANGES['volume'][0] <= volume <= AZURE_PARAM_RANGES['volume'][1]):
                  raise ValueError("Volume out of range")
+             deadline = synthesis_deadline(data, priority)
         except (TypeError, ValueError) as e:
              logger.warning(f"Invalid parameter type for Azure synthesis: {e}")
              return jsonify({"error": f"无效的语音参数: {e}"}), 400
 
-        logger.info(f"Azure Synthesis Params: Region={region}, Voice={voice}, Style={style}, Locale={locale}, Rate={rate}%, Pitch={pitch}%, Volume={volume}%")
+        logger.info(f"Azure Synthesis Params: Region={region}, Voice={voice}, Style={style}, Locale={locale}, Rate={rate}%, Pitch={pitch}%, Volume={volume}%, Priority={priority}")
 
         # Construct SSML
         # Escape special XML characters in text
@@ -408,39 +735,92 @@ def azure_synthesize():
 
         logger.debug(f"Azure SSML Payload: {ssml}")
 
-        tts_url = f"https://{region}.tts.speech.microsoft.com/cognitiveservices/v1"
+        tts_url = f"{azure_endpoint(region)}/cognitiveservices/v1"
         headers = {
             'Ocp-Apim-Subscription-Key': api_key,
             'Content-Type': 'application/ssml+xml',
-            'X-Microsoft-OutputFormat': 'audio-24khz-48kbitrate-mono-mp3', # Common high-quality format
+            'X-Microsoft-OutputFormat': AZURE_OUTPUT_FORMAT,
             'User-Agent': 'TTS-HTML-App/1.0' # Good practice to identify client
         }
 
+        # Identical requests from the same key reuse the audio already on disk
+        cache_digest = hashlib.sha256(
+            f"{usage_key_id(api_key)}|{region}|{AZURE_OUTPUT_FORMAT}|{ssml}".encode('utf-8')).hexdigest()[:32]
+        output_filename = f"azure_{cache_digest}.mp3"
+        output_filepath = validate_audio_filename(output_filename)
         try:
-            logger.info("Sending request to Azure TTS service...")
-            response = requests.post(tts_url, headers=headers, data=ssml.encode('utf-8'), timeout=30) # Add timeout
-            response.raise_for_status() # Check for HTTP errors
-
-            logger.info(f"Azure TTS request successful (Status: {response.status_code})")
-
-            # Use a unique filename for Azure audio too
-            file_id = str(uuid.uuid4())
-            output_filename = f"azure_{file_id}.mp3"
-            output_filepath = validate_audio_filename(output_filename)
+            os.utime(output_filepath) # Refresh mtime so cleanup keeps cached audio around
+            cached_size = os.path.getsize(output_filepath)
+        except OSError:
+            cached_size = None # Not cached (or cleaned up just now)
+        if cached_size is not None:
+            usage_ledger.record(api_key, region, voice, len(text),
+                                cached_size * 8 / AZURE_OUTPUT_BITRATE, source=SOURCE_CACHE)
+            logger.info(f"Serving cached Azure audio: {output_filename}")
+            return jsonify({
+                "audioUrl": f"/api/audio/{output_filename}",
+                "format": "mp3",
+                "cached": True
+            })
 
-            # Save the content to the temp audio directory
-            with open(output_filepath, 'wb') as f:
-                f.write(response.content)
-            logger.info(f"Saved Azure audio to: {output_filepath}")
+        is_cancelled = client_disconnect_checker()
+        try:
+            with usage_ledger.reserve(api_key, len(text)) as quota, \
+                    scheduler.slot(len(text), priority, deadline, is_cancelled) as ticket:
+                logger.info("Sending request to Azure TTS service...")
+                # Stream the body so a disconnected client or missed deadline can abort the download
+                response = requests.post(tts_url, headers=headers, data=ssml.encode('utf-8'),
+                                         timeout=max(1.0, min(30, ticket.remaining())), stream=True)
+                response.raise_for_status() # Check for HTTP errors
+
+                logger.info(f"Azure TTS request successful (Status: {response.status_code})")
+
+                # Download to a private partial file, then move it into place atomically
+                partial_filepath = validate_audio_filename(f"{output_filename}.{uuid.uuid4().hex}.part")
+                audio_bytes = 0
+                try:
+                    with open(partial_filepath, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=64 * 1024):
+                            audio_bytes += len(chunk)
+                            if is_cancelled():
+                                raise RequestCancelled("客户端已断开连接")
+                            if ticket.remaining() <= 0:
+                                raise TimeoutError("语音生成或获取超时")
+                            f.write(chunk)
+                    os.replace(partial_filepath, output_filepath)
+                except BaseException:
+                    response.close()
+                    if os.path.exists(partial_filepath):
+                        os.remove(partial_filepath)
+                    raise
+                finally:
+                    # Azure bills the characters once it accepted the request, even if the
+                    # download is abandoned, so record them before the reservation is released
+                    usage_ledger.record(api_key, region, voice, len(text),
+                                        audio_bytes * 8 / AZURE_OUTPUT_BITRATE, source=SOURCE_UPSTREAM)
+                logger.info(f"Saved Azure audio to: {output_filepath}")
 
             # Return the URL to access the saved file
-            return jsonify({
+            result = {
                 "audioUrl": f"/api/audio/{output_filename}",
                 "format": "mp3"
-            })
+            }
+            if quota["softExceeded"]:
+                result["quotaWarning"] = f"该密钥本月已使用约 {quota['used'] + len(text)} 字符，超过提醒阈值 {quota['soft']}"
+            return jsonify(result)
             # Alternative: Stream directly? Less robust for retries/downloads
             # return send_file(io.BytesIO(response.content), mimetype='audio/mpeg', as_attachment=False)
 
+        except QuotaExceeded as e:
+            return jsonify({"error": f"{e}（已用 {e.used} / 上限 {e.limit} 字符）"}), 429
+        except SchedulerRejected as e:
+            return scheduler_rejected_response(e)
+        except RequestCancelled:
+            logger.info("Azure synthesis abandoned: client disconnected")
+            return jsonify({"error": "客户端已断开连接"}), 499
+        except TimeoutError:
+            logger.error("Azure synthesis exceeded its deadline")
+            return jsonify({"error": "语音生成超时，请缩短文本后重试"}), 504
         except requests.exceptions.RequestException as e:
             logger.error(f"Error during Azure TTS request: {str(e)}", exc_info=True)
             status_code = e.response.status_code if e.response is not None else 500
@@ -461,9 +841,29 @@ def azure_synthesize():
         logger.error(f"Unexpected error in /api/azure/synthesize: {str(e)}", exc_info=True)
         return jsonify({"error": "发生意外错误，请稍后重试"}), 500
 
+@app.route('/api/azure/usage', methods=['GET'])
+def get_azure_usage():
+    """Reports characters and audio seconds used by the calling key, billed vs. cached."""
+    api_key = request.headers.get('Ocp-Apim-Subscription-Key')
+    if not api_key:
+        return jsonify({"error": "请求头中缺少 Azure API 密钥 (Ocp-Apim-Subscription-Key)"}), 400
+    period = request.args.get('period', 'month')
+    if period not in ('month', 'all'):
+        return jsonify({"error": "无效的统计周期，请选择 month 或 all"}), 400
+    try:
+        return jsonify(usage_ledger.report(api_key, since=0 if period == 'all' else None))
+    except Exception as e:
+        logger.error(f"Error building Azure usage report: {str(e)}", exc_info=True)
+        return jsonify({"error": "获取用量统计失败"}), 500
+
 # ----------------------------------------------------
 # Shared API Routes (Audio Serving, Presets)
 # ----------------------------------------------------
+@app.route('/api/scheduler', methods=['GET'])
+def get_scheduler_status():
+    """Reports synthesis queue depth, running jobs and admission counters."""
+    return jsonify(scheduler.stats())
+
 @app.route('/api/audio/<filename>', methods=['GET'])
 def get_audio(filename):
     """Serves the generated audio file."""
@@ -498,7 +898,7 @@ def get_audio(filename):
 def manage_edge_presets():
     """Manages presets specifically for Edge TTS."""
     logger.info(f"Request received for Edge presets: {request.method}")
-    preset_prefix = "edge_"
+    preset_prefix = EDGE_PRESET_PREFIX
     try:
         if request.method == 'GET':
             preset_name = request.args.get('name')
@@ -524,24 +924,8 @@ def manage_edge_presets():
                     logger.warning(f"Edge preset not found: {preset_name} (File: {filename})")
                     return jsonify({"error": "预设不存在"}), 404
             else:
-                # List all Edge presets
-                presets = []
-                logger.debug(f"Listing Edge presets from: {PRESETS_DIR}")
-                for filename in os.listdir(PRESETS_DIR):
-                    if filename.startswith(preset_prefix) and filename.endswith('.json'):
-                        preset_name = filename[len(preset_prefix):-5] # Extract name
-                        filepath = os.path.join(PRESETS_DIR, filename)
-                        try:
-                            with open(filepath, 'r', encoding='utf-8') as f:
-                                preset = json.load(f)
-                                presets.append({
-                                    "name": preset_name,
-                                    "voice": preset.get("voice", ""),
-                                    # Include other fields if needed for display
-                                })
-                        except Exception as e:
-                            logger.error(f"Error reading preset file {filename}: {e}")
-                presets.sort(key=lambda x: x['name']) # Sort alphabetically
+                # List all Edge presets, with full parameters so no per-preset fetch is needed
+                presets = load_presets(preset_prefix, EDGE_PRESET_FIELDS)
                 logger.info(f"Found {len(presets)} Edge presets.")
                 return jsonify(presets) # Return list directly as expected by JS
 
@@ -595,7 +979,7 @@ def manage_edge_presets():
 def manage_azure_presets():
     """Manages presets specifically for Azure TTS."""
     logger.info(f"Request received for Azure presets: {request.method}")
-    preset_prefix = "azure_" # Distinct prefix
+    preset_prefix = AZURE_PRESET_PREFIX # Distinct prefix
     try:
         if request.method == 'GET':
             preset_name = request.args.get('name')
@@ -622,25 +1006,8 @@ def manage_azure_presets():
                     logger.warning(f"Azure preset not found: {preset_name} (File: {filename})")
                     return jsonify({"error": "预设不存在"}), 404
             else:
-                # List all Azure presets
-                presets = []
-                logger.debug(f"Listing Azure presets from: {PRESETS_DIR}")
-                for filename in os.listdir(PRESETS_DIR):
-                    if filename.startswith(preset_prefix) and filename.endswith('.json'):
-                        preset_name = filename[len(preset_prefix):-5] # Extract name
-                        filepath = os.path.join(PRESETS_DIR, filename)
-                        try:
-                            with open(filepath, 'r', encoding='utf-8') as f:
-                                preset = json.load(f)
-                                presets.append({
-                                    "name": preset_name,
-                                    "voice": preset.get("voice", ""),
-                                    # Include style for display?
-                                    "style": preset.get("style", "general"),
-                                })
-                        except Exception as e:
-                            logger.error(f"Error reading preset file {filename}: {e}")
-                presets.sort(key=lambda x: x['name']) # Sort alphabetically
+                # List all Azure presets, with full parameters
+                presets = load_presets(preset_prefix, AZURE_PRESET_FIELDS)
                 logger.info(f"Found {len(presets)} Azure presets.")
                 return jsonify(presets) # Return list directly
 
@@ -711,6 +1078,10 @@ def cleanup_scheduler():
             cleanup_old_files()
         except Exception as e:
             logger.error(f"Error in cleanup scheduler loop: {str(e)}")
+        try:
+            usage_ledger.compact()
+        except Exception as e:
+            logger.error(f"Error compacting usage ledger: {str(e)}")
         # Sleep until the next interval
         time.sleep(CLEANUP_INTERVAL)
 
@@ -725,5 +1096,5 @@ if __name__ == "__main__":
 
     # Start Flask app
     # Use host='0.0.0.0' to make it accessible on the network if needed
-    logger.info("Starting Flask development server...")
-    app.run(host='127.0.0.1', port=5000, debug=False, threaded=True) # Disable debug for production-like testing if needed
\ No newline at end of file
+    logger.info(f"Starting Flask development server on {HOST}:{PORT}...")
+    app.run(host=HOST, port=PORT, debug=False, threaded=True) # Disable debug for production-like testing if needed
\ No newline at end of file
@@ -0,0 +1,235 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------------------------------
+# Priority classes
+# ----------------------------------------------------
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITY_RANK = {INTERACTIVE: 0, BULK: 1}
+
+
+class SchedulerRejected(Exception):
+    """Raised when a request cannot be served before its deadline (maps to 503 + Retry-After)."""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class RequestCancelled(Exception):
+    """Raised when the HTTP client disconnects while its request is queued or running."""
+
+
+class SynthesisTicket:
+    """A single admitted synthesis request."""
+    def __init__(self, seq, priority, chars, deadline, estimate):
+        self.seq = seq
+        self.priority = priority
+        self.chars = chars
+        self.deadline = deadline  # time.monotonic() based
+        self.estimate = estimate  # Expected service time in seconds
+        self.granted = False
+        self.started_at = None
+
+    def sort_key(self):
+        # Interactive before bulk, then earliest deadline first
+        return (PRIORITY_RANK[self.priority], self.deadline, self.seq)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    def remaining(self):
+        """Seconds left until this ticket's deadline."""
+        return self.deadline - time.monotonic()
+
+
+class SynthesisScheduler:
+    """
+    Priority- and deadline-aware concurrency gate for synthesis requests.
+
+    Requests are classified as interactive (short text) or bulk (long text). At most
+    `max_concurrent` requests run at once and bulk work may only occupy
+    `bulk_max_concurrent` of those slots, so short utterances always have capacity.
+    Queued requests are dispatched interactive-first, earliest-deadline-first.
+
+    Admission control estimates how long a new request would wait plus how long it
+    would take to serve (learned per class from completed requests) and rejects it
+    immediately if it could not finish before its deadline.
+
+    With a single slot (`max_concurrent=1`) there is nothing to reserve, so bulk work
+    shares that slot and interactive requests may have to wait for it.
+    """
+
+    def __init__(self, max_concurrent=4, bulk_max_concurrent=None, interactive_max_chars=500,
+                 max_queue=32, base_seconds=1.0, seconds_per_char=0.002, poll_interval=0.25):
+        self.max_concurrent = max(1, max_concurrent)
+        if bulk_max_concurrent is None:
+            bulk_max_concurrent = self.max_concurrent - 1
+        self.bulk_max_concurrent = max(1, min(bulk_max_concurrent, self.max_concurrent))
+        if self.bulk_max_concurrent >= self.max_concurrent:
+            logger.warning(f"Bulk requests may occupy all {self.max_concurrent} synthesis slot(s); "
+                           f"interactive requests can be queued behind bulk work")
+        self.interactive_max_chars = interactive_max_chars
+        self.max_queue = max_queue
+        self.base_seconds = base_seconds
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._queue = []      # Heap of SynthesisTicket
+        self._running = set()
+        self._seq = itertools.count()
+        # Moving average of seconds per character, per priority class
+        self._seconds_per_char = {INTERACTIVE: seconds_per_char, BULK: seconds_per_char}
+        self._counters = {'admitted': 0, 'rejected': 0, 'expired': 0, 'cancelled': 0, 'completed': 0}
+
+    # ---------- Classification & estimates ----------
+    def classify(self, chars, requested=None):
+        """Returns the priority class for a request. Long texts can never be interactive."""
+        if chars > self.interactive_max_chars or requested == BULK:
+            return BULK
+        return INTERACTIVE
+
+    def estimate(self, priority, chars):
+        """Expected service time in seconds for `chars` characters."""
+        return self.base_seconds + chars * self._seconds_per_char[priority]
+
+    def _running_count(self, priority=None):
+        if priority is None:
+            return len(self._running)
+        return sum(1 for t in self._running if t.priority == priority)
+
+    def _can_run(self, priority):
+        if len(self._running) >= self.max_concurrent:
+            return False
+        return priority == INTERACTIVE or self._running_count(BULK) < self.bulk_max_concurrent
+
+    def _estimated_wait(self, priority, deadline):
+        """
+        Rough seconds until a new ticket of this class would start running.
+
+        Replays `_dispatch` against the expected finish times of the running tickets
+        and the queued tickets ahead of the new one, so a request only waits for a
+        slot its class may use to free up, not for all outstanding work.
+        """
+        now = time.monotonic()
+        new_key = (PRIORITY_RANK[priority], deadline, math.inf)
+        pending = [(t.priority, t.estimate) for t in sorted(self._queue) if t.sort_key() < new_key]
+        pending.append((priority, None))
+        # (expected finish time relative to now, priority class) per occupied slot
+        running = [(max(0.0, t.estimate - (now - t.started_at)), t.priority) for t in self._running]
+        clock = 0.0
+        while True:
+            head_priority, estimate = pending[0]
+            bulk_running = sum(1 for _, p in running if p == BULK)
+            if len(running) < self.max_concurrent and (
+                    head_priority == INTERACTIVE or bulk_running < self.bulk_max_concurrent):
+                if estimate is None:
+                    return clock
+                pending.pop(0)
+                running.append((clock + estimate, head_priority))
+                continue
+            # Nothing can start until the next running ticket finishes
+            finished = min(running)
+            running.remove(finished)
+            clock = max(clock, finished[0])
+
+    # ---------- Admission & dispatch ----------
+    def admit(self, chars, priority, timeout):
+        """Admits a request or raises SchedulerRejected if it cannot meet `timeout` seconds."""
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            estimate = self.estimate(priority, chars)
+            wait = self._estimated_wait(priority, deadline)
+            if len(self._queue) >= self.max_queue:
+                self._counters['rejected'] += 1
+                logger.warning(f"Scheduler queue full ({len(self._queue)}), rejecting {priority} request")
+                raise SchedulerRejected("服务器繁忙，请稍后再试", retry_after=wait or estimate)
+            if wait + estimate > timeout:
+                self._counters['rejected'] += 1
+                logger.warning(f"Rejecting {priority} request ({chars} chars): estimated wait {wait:.1f}s "
+                               f"+ service {estimate:.1f}s exceeds deadline {timeout:.1f}s")
+                raise SchedulerRejected("服务器繁忙，预计无法在时限内完成，请稍后再试", retry_after=wait or estimate)
+
+            ticket = SynthesisTicket(next(self._seq), priority, chars, deadline, estimate)
+            heapq.heappush(self._queue, ticket)
+            self._counters['admitted'] += 1
+            self._dispatch()
+            return ticket
+
+    def _dispatch(self):
+        """Grants slots to queued tickets in priority order. Caller holds the lock."""
+        granted = False
+        while self._queue and self._can_run(self._queue[0].priority):
+            ticket = heapq.heappop(self._queue)
+            ticket.granted = True
+            ticket.started_at = time.monotonic()
+            self._running.add(ticket)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _withdraw(self, ticket):
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+
+    def acquire(self, ticket, is_cancelled=None):
+        """Blocks until `ticket` may run, its deadline passes, or the client goes away."""
+        with self._cond:
+            while not ticket.granted:
+                remaining = ticket.remaining()
+                if remaining <= 0:
+                    self._withdraw(ticket)
+                    self._counters['expired'] += 1
+                    raise SchedulerRejected("排队超时，请稍后再试", retry_after=self._estimated_wait(
+                        ticket.priority, time.monotonic() + ticket.estimate))
+                if is_cancelled is not None and is_cancelled():
+                    self._withdraw(ticket)
+                    self._counters['cancelled'] += 1
+                    raise RequestCancelled("客户端已断开连接")
+                self._cond.wait(min(self.poll_interval, remaining))
+
+    def release(self, ticket, completed=True):
+        """Frees the ticket's slot and, on success, updates the service time estimate."""
+        with self._cond:
+            self._running.discard(ticket)
+            if completed and ticket.started_at is not None:
+                self._counters['completed'] += 1
+                elapsed = time.monotonic() - ticket.started_at
+                observed = max(0.0, elapsed - self.base_seconds) / max(ticket.chars, 1)
+                current = self._seconds_per_char[ticket.priority]
+                self._seconds_per_char[ticket.priority] = 0.8 * current + 0.2 * observed
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, chars, priority, timeout, is_cancelled=None):
+        """Admits, waits for and holds a synthesis slot for the duration of the block."""
+        ticket = self.admit(chars, priority, timeout)
+        self.acquire(ticket, is_cancelled)
+        completed = False
+        try:
+            yield ticket
+            completed = True
+        finally:
+            self.release(ticket, completed=completed)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": {INTERACTIVE: self._running_count(INTERACTIVE), BULK: self._running_count(BULK)},
+                "queued": {
+                    INTERACTIVE: sum(1 for t in self._queue if t.priority == INTERACTIVE),
+                    BULK: sum(1 for t in self._queue if t.priority == BULK),
+                },
+                "max_concurrent": self.max_concurrent,
+                "bulk_max_concurrent": self.bulk_max_concurrent,
+                "seconds_per_char": dict(self._seconds_per_char),
+                "counters": dict(self._counters),
+            }
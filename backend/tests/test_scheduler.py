@@ -0,0 +1,165 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import SynthesisScheduler, SchedulerRejected, RequestCancelled, INTERACTIVE, BULK
+
+
+def make_scheduler(**kwargs):
+    kwargs.setdefault('poll_interval', 0.01)
+    return SynthesisScheduler(**kwargs)
+
+
+def start(scheduler, chars, priority, timeout=60):
+    ticket = scheduler.admit(chars, priority, timeout)
+    scheduler.acquire(ticket)
+    return ticket
+
+
+class ClassificationTest(unittest.TestCase):
+    def test_long_text_is_always_bulk(self):
+        scheduler = make_scheduler(interactive_max_chars=500)
+        self.assertEqual(scheduler.classify(500), INTERACTIVE)
+        self.assertEqual(scheduler.classify(501), BULK)
+        self.assertEqual(scheduler.classify(501, requested=INTERACTIVE), BULK)
+        self.assertEqual(scheduler.classify(10, requested=BULK), BULK)
+
+    def test_bulk_cap_leaves_a_slot_for_interactive(self):
+        self.assertEqual(make_scheduler(max_concurrent=4).bulk_max_concurrent, 3)
+        self.assertEqual(make_scheduler(max_concurrent=4, bulk_max_concurrent=10).bulk_max_concurrent, 4)
+        # A single slot can't be reserved, so bulk shares it
+        self.assertEqual(make_scheduler(max_concurrent=1).bulk_max_concurrent, 1)
+
+
+class AdmissionTest(unittest.TestCase):
+    def test_idle_scheduler_grants_immediately(self):
+        scheduler = make_scheduler()
+        ticket = scheduler.admit(100, INTERACTIVE, 30)
+        self.assertTrue(ticket.granted)
+
+    def test_interactive_is_not_charged_for_running_bulk_work(self):
+        # Default settings: 4 slots, bulk cap 3, 1s base + 2ms/char
+        scheduler = make_scheduler()
+        for _ in range(3):
+            start(scheduler, 20000, BULK, timeout=180)
+        start(scheduler, 200, INTERACTIVE, timeout=30)
+
+        wait = scheduler._estimated_wait(INTERACTIVE, time.monotonic() + 30)
+        self.assertLess(wait, scheduler.estimate(INTERACTIVE, 200) + 0.1)
+        ticket = scheduler.admit(200, INTERACTIVE, 30)
+        self.assertFalse(ticket.granted)
+
+    def test_bulk_waits_for_a_bulk_slot(self):
+        scheduler = make_scheduler(max_concurrent=4, bulk_max_concurrent=1)
+        start(scheduler, 20000, BULK, timeout=180) # ~41s
+        start(scheduler, 200, INTERACTIVE)         # ~1.4s
+
+        wait = scheduler._estimated_wait(BULK, time.monotonic() + 180)
+        self.assertGreater(wait, 40)
+
+    def test_rejects_request_that_cannot_meet_its_deadline(self):
+        scheduler = make_scheduler(max_concurrent=1)
+        start(scheduler, 20000, BULK, timeout=180)
+
+        with self.assertRaises(SchedulerRejected) as ctx:
+            scheduler.admit(100, INTERACTIVE, 5)
+        self.assertGreaterEqual(ctx.exception.retry_after, 40)
+        self.assertEqual(scheduler.stats()["counters"]["rejected"], 1)
+
+    def test_rejects_when_queue_is_full(self):
+        scheduler = make_scheduler(max_concurrent=1, max_queue=1, base_seconds=0.01, seconds_per_char=0)
+        start(scheduler, 10, INTERACTIVE)
+        scheduler.admit(10, INTERACTIVE, 30)
+
+        with self.assertRaises(SchedulerRejected):
+            scheduler.admit(10, INTERACTIVE, 30)
+
+
+class DispatchTest(unittest.TestCase):
+    def test_interactive_first_then_earliest_deadline(self):
+        scheduler = make_scheduler(max_concurrent=1, base_seconds=0.01, seconds_per_char=0)
+        running = start(scheduler, 10, INTERACTIVE)
+        bulk = scheduler.admit(1000, BULK, 60)
+        late = scheduler.admit(10, INTERACTIVE, 60)
+        early = scheduler.admit(10, INTERACTIVE, 30)
+
+        order = []
+        for ticket in (running, early, late, bulk):
+            self.assertTrue(ticket.granted)
+            order.append(ticket)
+            scheduler.release(ticket)
+        self.assertEqual(order, [running, early, late, bulk])
+        self.assertEqual(scheduler.stats()["counters"]["completed"], 4)
+
+    def test_bulk_cap_does_not_block_interactive(self):
+        scheduler = make_scheduler(max_concurrent=2, bulk_max_concurrent=1, base_seconds=0.01, seconds_per_char=0)
+        start(scheduler, 1000, BULK)
+        queued_bulk = scheduler.admit(1000, BULK, 60)
+        interactive = scheduler.admit(10, INTERACTIVE, 60)
+
+        self.assertFalse(queued_bulk.granted)
+        self.assertTrue(interactive.granted)
+
+    def test_waiting_ticket_runs_when_slot_is_released(self):
+        scheduler = make_scheduler(max_concurrent=1, base_seconds=0.01, seconds_per_char=0)
+        running = start(scheduler, 10, INTERACTIVE)
+        waiting = scheduler.admit(10, INTERACTIVE, 30)
+
+        timer = threading.Timer(0.05, scheduler.release, args=(running,))
+        timer.start()
+        scheduler.acquire(waiting)
+        timer.join()
+        self.assertTrue(waiting.granted)
+
+    def test_release_updates_service_time_estimate(self):
+        scheduler = make_scheduler(base_seconds=0, seconds_per_char=0.1)
+        ticket = start(scheduler, 100, INTERACTIVE)
+        scheduler.release(ticket)
+        self.assertLess(scheduler.stats()["seconds_per_char"][INTERACTIVE], 0.1)
+        self.assertEqual(scheduler.stats()["seconds_per_char"][BULK], 0.1)
+
+    def test_failed_request_does_not_update_estimate(self):
+        scheduler = make_scheduler(base_seconds=0, seconds_per_char=0.1)
+        with self.assertRaises(RuntimeError):
+            with scheduler.slot(100, INTERACTIVE, 30):
+                raise RuntimeError("upstream failed")
+        stats = scheduler.stats()
+        self.assertEqual(stats["seconds_per_char"][INTERACTIVE], 0.1)
+        self.assertEqual(stats["running"][INTERACTIVE], 0)
+        self.assertEqual(stats["counters"]["completed"], 0)
+
+
+class WaitingTest(unittest.TestCase):
+    def setUp(self):
+        # Estimates far below reality, so requests are admitted but then have to wait
+        self.scheduler = make_scheduler(max_concurrent=1, base_seconds=0, seconds_per_char=0.0001)
+        self.running = start(self.scheduler, 10, INTERACTIVE)
+
+    def test_expired_ticket_is_rejected_and_withdrawn(self):
+        ticket = self.scheduler.admit(10, INTERACTIVE, 0.05)
+        with self.assertRaises(SchedulerRejected):
+            self.scheduler.acquire(ticket)
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["counters"]["expired"], 1)
+        self.assertEqual(stats["queued"][INTERACTIVE], 0)
+
+    def test_cancelled_ticket_is_withdrawn(self):
+        ticket = self.scheduler.admit(10, INTERACTIVE, 30)
+        with self.assertRaises(RequestCancelled):
+            self.scheduler.acquire(ticket, is_cancelled=lambda: True)
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["counters"]["cancelled"], 1)
+        self.assertEqual(stats["queued"][INTERACTIVE], 0)
+
+        # The slot goes to the next request, not the cancelled one
+        self.scheduler.release(self.running)
+        self.assertFalse(ticket.granted)
+        self.assertTrue(self.scheduler.admit(10, INTERACTIVE, 30).granted)
+
+
+if __name__ == '__main__':
+    unittest.main()
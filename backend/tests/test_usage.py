@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usage import UsageLedger, QuotaExceeded, SOURCE_CACHE, SOURCE_UPSTREAM, key_id
+
+DAY = 86400
+
+
+class UsageLedgerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, 'usage.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def make_ledger(self, **kwargs):
+        return UsageLedger(self.db_path, **kwargs)
+
+    def raw_event_count(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM usage_events").fetchone()[0]
+
+
+class QuotaTest(UsageLedgerTestCase):
+    def test_reserve_holds_characters_until_released(self):
+        ledger = self.make_ledger(hard_limit=100)
+        kid = key_id('key-a')
+        with ledger.reserve('key-a', 60) as status:
+            self.assertFalse(status["hardExceeded"])
+            self.assertEqual(ledger.quota_status(kid)["used"], 60)
+            # A concurrent request can't use the reserved characters
+            with self.assertRaises(QuotaExceeded):
+                with ledger.reserve('key-a', 50):
+                    pass
+        self.assertEqual(ledger.quota_status(kid)["used"], 0)
+
+    def test_hard_quota_counts_billed_characters(self):
+        ledger = self.make_ledger(hard_limit=100)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 90, 5.0)
+
+        with self.assertRaises(QuotaExceeded) as ctx:
+            with ledger.reserve('key-a', 20):
+                pass
+        self.assertEqual(ctx.exception.used, 90)
+        self.assertEqual(ctx.exception.limit, 100)
+        with ledger.reserve('key-a', 10):
+            pass
+
+    def test_soft_quota_only_warns(self):
+        ledger = self.make_ledger(soft_limit=50, hard_limit=100)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 40, 2.0)
+
+        with ledger.reserve('key-a', 20) as status:
+            self.assertTrue(status["softExceeded"])
+            self.assertFalse(status["hardExceeded"])
+
+    def test_cache_hits_do_not_count_towards_quota(self):
+        ledger = self.make_ledger(hard_limit=100)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 90, 5.0, source=SOURCE_CACHE)
+
+        with ledger.reserve('key-a', 100):
+            pass
+
+    def test_quotas_are_per_key(self):
+        ledger = self.make_ledger(hard_limit=100)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 100, 5.0)
+
+        with ledger.reserve('key-b', 100):
+            pass
+
+    def test_quota_file_overrides_defaults(self):
+        quota_file = os.path.join(self.tmpdir, 'quotas.json')
+        with open(quota_file, 'w', encoding='utf-8') as f:
+            json.dump({key_id('key-a'): {"soft": 5, "hard": 10}}, f)
+        ledger = self.make_ledger(soft_limit=50, hard_limit=100, quota_file=quota_file)
+
+        self.assertEqual(ledger.limits_for(key_id('key-a')), (5, 10))
+        self.assertEqual(ledger.limits_for(key_id('key-b')), (50, 100))
+        with self.assertRaises(QuotaExceeded):
+            with ledger.reserve('key-a', 20):
+                pass
+
+    def test_zero_limits_disable_quotas(self):
+        ledger = self.make_ledger()
+        with ledger.reserve('key-a', 10 ** 9) as status:
+            self.assertIsNone(status["soft"])
+            self.assertIsNone(status["hard"])
+
+
+class ReportTest(UsageLedgerTestCase):
+    def test_report_splits_billed_and_cached(self):
+        ledger = self.make_ledger()
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 100, 6.0)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 50, 3.0)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 100, 6.0, source=SOURCE_CACHE)
+        ledger.record('key-a', 'westus', 'en-US-JennyNeural', 20, 1.5)
+        ledger.record('key-b', 'eastus', 'zh-CN-XiaoxiaoNeural', 999, 60.0)
+
+        report = ledger.report('key-a')
+        self.assertEqual(report["keyId"], key_id('key-a'))
+        self.assertEqual(report["billed"], {"requests": 3, "chars": 170, "audioSeconds": 10.5})
+        self.assertEqual(report["cached"], {"requests": 1, "chars": 100, "audioSeconds": 6.0})
+        self.assertEqual(report["quota"]["used"], 170)
+        self.assertEqual(len(report["breakdown"]), 3)
+
+
+class CompactionTest(UsageLedgerTestCase):
+    def record_at(self, ledger, ts, *args, **kwargs):
+        with mock.patch('usage.time.time', return_value=ts):
+            ledger.record(*args, **kwargs)
+
+    def test_compaction_rolls_up_old_events_and_keeps_totals(self):
+        ledger = self.make_ledger(raw_retention_days=7)
+        now = time.time()
+        for days_ago in (30, 30, 20):
+            self.record_at(ledger, now - days_ago * DAY, 'key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 100, 6.0)
+        self.record_at(ledger, now - 30 * DAY, 'key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 40, 2.0,
+                       source=SOURCE_CACHE)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 10, 1.0)
+
+        since = now - 60 * DAY
+        before = ledger.report('key-a', since=since)
+        billed_before = ledger.billed_chars(key_id('key-a'), since)
+
+        self.assertEqual(ledger.compact(), 4)
+        self.assertEqual(self.raw_event_count(), 1)
+
+        after = ledger.report('key-a', since=since)
+        self.assertEqual(after["billed"], before["billed"])
+        self.assertEqual(after["cached"], before["cached"])
+        self.assertEqual(after["billed"]["chars"], 310)
+        self.assertEqual(ledger.billed_chars(key_id('key-a'), since), billed_before)
+
+    def test_repeated_compaction_merges_into_existing_rollups(self):
+        ledger = self.make_ledger(raw_retention_days=7)
+        old = time.time() - 30 * DAY
+        self.record_at(ledger, old, 'key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 100, 6.0)
+        ledger.compact()
+        self.record_at(ledger, old, 'key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 50, 3.0)
+        ledger.compact()
+
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute("SELECT requests, chars FROM usage_daily").fetchall()
+        self.assertEqual(rows, [(2, 150)])
+        self.assertEqual(ledger.compact(), 0)
+
+    def test_recent_events_are_kept_raw(self):
+        ledger = self.make_ledger(raw_retention_days=7)
+        ledger.record('key-a', 'eastus', 'zh-CN-XiaoxiaoNeural', 100, 6.0)
+
+        self.assertEqual(ledger.compact(), 0)
+        self.assertEqual(self.raw_event_count(), 1)
+        self.assertEqual(ledger.report('key-a')["billed"]["chars"], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
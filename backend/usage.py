@@ -0,0 +1,230 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SOURCE_UPSTREAM = 'upstream' # Billed by Azure
+SOURCE_CACHE = 'cache'       # Served from our cache, not billed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    key_id TEXT NOT NULL,
+    region TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    source TEXT NOT NULL,
+    chars INTEGER NOT NULL,
+    audio_seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_events_key_ts ON usage_events (key_id, ts);
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,
+    key_id TEXT NOT NULL,
+    region TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    source TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    chars INTEGER NOT NULL,
+    audio_seconds REAL NOT NULL,
+    PRIMARY KEY (day, key_id, region, voice, source)
+);
+"""
+
+
+def key_id(api_key):
+    """Stable, non-reversible identifier for an API key. Raw keys are never stored."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def month_start(now=None):
+    """Unix timestamp of the start of the current UTC calendar month."""
+    now = datetime.fromtimestamp(now if now is not None else time.time(), tz=timezone.utc)
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+class QuotaExceeded(Exception):
+    """Raised when a request would push a key past its hard quota."""
+    def __init__(self, message, used, limit):
+        super().__init__(message)
+        self.used = used
+        self.limit = limit
+
+
+class UsageLedger:
+    """
+    Append-only usage ledger for Azure synthesis, backed by SQLite.
+
+    Every request appends a row to `usage_events`. `compact()` periodically rolls
+    events older than the retention window up into per-day totals in `usage_daily`,
+    so the database stays small while monthly totals remain exact.
+
+    Quotas are counted in billed characters per calendar month (UTC). Characters
+    that are reserved by in-flight requests count towards the quota, so concurrent
+    requests can't jointly overshoot it.
+    """
+
+    def __init__(self, db_path, soft_limit=0, hard_limit=0, quota_file=None, raw_retention_days=7):
+        self.db_path = db_path
+        self.soft_limit = soft_limit # 0 disables the limit
+        self.hard_limit = hard_limit
+        self.quota_file = quota_file
+        self.raw_retention = raw_retention_days * 86400
+        self._lock = threading.Lock()
+        self._pending = {} # key_id -> characters reserved by in-flight requests
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn: # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- Quotas ----------
+    def limits_for(self, kid):
+        """Returns (soft, hard) character limits for a key, applying per-key overrides."""
+        soft, hard = self.soft_limit, self.hard_limit
+        if self.quota_file and os.path.exists(self.quota_file):
+            try:
+                with open(self.quota_file, 'r', encoding='utf-8') as f:
+                    override = json.load(f).get(kid, {})
+                soft = int(override.get('soft', soft))
+                hard = int(override.get('hard', hard))
+            except (OSError, ValueError, AttributeError) as e:
+                logger.error(f"Error reading quota file {self.quota_file}: {e}")
+        return soft, hard
+
+    def billed_chars(self, kid, since):
+        """Characters billed upstream for a key since `since` (a UTC day boundary)."""
+        since_day = datetime.fromtimestamp(since, tz=timezone.utc).strftime('%Y-%m-%d')
+        with self._connect() as conn:
+            raw = conn.execute(
+                "SELECT COALESCE(SUM(chars), 0) FROM usage_events WHERE key_id = ? AND source = ? AND ts >= ?",
+                (kid, SOURCE_UPSTREAM, since)).fetchone()[0]
+            rolled = conn.execute(
+                "SELECT COALESCE(SUM(chars), 0) FROM usage_daily WHERE key_id = ? AND source = ? AND day >= ?",
+                (kid, SOURCE_UPSTREAM, since_day)).fetchone()[0]
+        return raw + rolled
+
+    def quota_status(self, kid, extra_chars=0):
+        soft, hard = self.limits_for(kid)
+        used = self.billed_chars(kid, month_start()) + self._pending.get(kid, 0)
+        projected = used + extra_chars
+        return {
+            "used": used,
+            "soft": soft or None,
+            "hard": hard or None,
+            "softExceeded": bool(soft) and projected > soft,
+            "hardExceeded": bool(hard) and projected > hard,
+        }
+
+    @contextmanager
+    def reserve(self, api_key, chars):
+        """
+        Checks the quota for `chars` more billed characters and holds them while the
+        upstream request runs. Raises QuotaExceeded if the hard quota would be exceeded.
+        Yields the quota status so callers can surface soft-quota warnings.
+        """
+        kid = key_id(api_key)
+        with self._lock:
+            status = self.quota_status(kid, chars)
+            if status["hardExceeded"]:
+                logger.warning(f"Hard quota exceeded for key {kid}: {status['used']} + {chars} > {status['hard']}")
+                raise QuotaExceeded("已超出该密钥本月的 Azure 用量配额", status["used"], status["hard"])
+            if status["softExceeded"]:
+                logger.warning(f"Soft quota exceeded for key {kid}: {status['used']} + {chars} > {status['soft']}")
+            self._pending[kid] = self._pending.get(kid, 0) + chars
+        try:
+            yield status
+        finally:
+            with self._lock:
+                self._pending[kid] -= chars
+                if not self._pending[kid]:
+                    del self._pending[kid]
+
+    # ---------- Recording ----------
+    def record(self, api_key, region, voice, chars, audio_seconds, source=SOURCE_UPSTREAM):
+        """Appends one usage event."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO usage_events (ts, key_id, region, voice, source, chars, audio_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), key_id(api_key), region, voice, source, chars, audio_seconds))
+
+    def compact(self):
+        """Rolls raw events older than the retention window up into daily totals."""
+        cutoff = time.time() - self.raw_retention
+        # Only roll up whole days so a day's raw events and its rollup never overlap
+        cutoff_day = datetime.fromtimestamp(cutoff, tz=timezone.utc).strftime('%Y-%m-%d')
+        with self._lock, self._connect() as conn:
+            conn.execute("""
+                INSERT INTO usage_daily (day, key_id, region, voice, source, requests, chars, audio_seconds)
+                SELECT date(ts, 'unixepoch') AS d, key_id, region, voice, source,
+                       COUNT(*), SUM(chars), SUM(audio_seconds)
+                FROM usage_events WHERE date(ts, 'unixepoch') < ?
+                GROUP BY d, key_id, region, voice, source
+                ON CONFLICT (day, key_id, region, voice, source) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    chars = chars + excluded.chars,
+                    audio_seconds = audio_seconds + excluded.audio_seconds
+            """, (cutoff_day,))
+            removed = conn.execute(
+                "DELETE FROM usage_events WHERE date(ts, 'unixepoch') < ?", (cutoff_day,)).rowcount
+        logger.info(f"Usage ledger compaction finished. Rolled up {removed} events.")
+        return removed
+
+    # ---------- Reporting ----------
+    def report(self, api_key, since=None):
+        """Usage for one key since `since` (default: start of this month), by region/voice/source."""
+        kid = key_id(api_key)
+        since = month_start() if since is None else since
+        since_day = datetime.fromtimestamp(since, tz=timezone.utc).strftime('%Y-%m-%d')
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT region, voice, source, SUM(requests), SUM(chars), SUM(audio_seconds) FROM (
+                    SELECT region, voice, source, COUNT(*) AS requests, SUM(chars) AS chars,
+                           SUM(audio_seconds) AS audio_seconds
+                    FROM usage_events WHERE key_id = ? AND ts >= ?
+                    GROUP BY region, voice, source
+                    UNION ALL
+                    SELECT region, voice, source, requests, chars, audio_seconds
+                    FROM usage_daily WHERE key_id = ? AND day >= ?
+                ) GROUP BY region, voice, source ORDER BY region, voice, source
+            """, (kid, since, kid, since_day)).fetchall()
+
+        breakdown = []
+        totals = {s: {"requests": 0, "chars": 0, "audioSeconds": 0.0} for s in (SOURCE_UPSTREAM, SOURCE_CACHE)}
+        for region, voice, source, requests, chars, audio_seconds in rows:
+            breakdown.append({
+                "region": region,
+                "voice": voice,
+                "source": source,
+                "requests": requests,
+                "chars": chars,
+                "audioSeconds": round(audio_seconds, 2),
+            })
+            bucket = totals.setdefault(source, {"requests": 0, "chars": 0, "audioSeconds": 0.0})
+            bucket["requests"] += requests
+            bucket["chars"] += chars
+            bucket["audioSeconds"] = round(bucket["audioSeconds"] + audio_seconds, 2)
+
+        return {
+            "keyId": kid,
+            "since": datetime.fromtimestamp(since, tz=timezone.utc).isoformat(),
+            "billed": totals[SOURCE_UPSTREAM],
+            "cached": totals[SOURCE_CACHE], # Characters we did not pay for thanks to the cache
+            "quota": self.quota_status(kid),
+            "breakdown": breakdown,
+        }
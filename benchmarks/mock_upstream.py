@@ -0,0 +1,290 @@
+"""
+Local stand-in for the Microsoft TTS upstreams used by backend/app.py.
+
+Emulates:
+  - the edge-tts WebSocket protocol (speech.config / ssml -> turn.start, audio, turn.end)
+  - the edge-tts voice list endpoint
+  - Azure's /cognitiveservices/v1 and /cognitiveservices/voices/list endpoints
+
+Latency, audio throughput and error injection are configurable so benchmark runs
+are reproducible without touching the real services. The audio returned is silent
+MPEG-2 Layer III (24kHz, 48kbps, mono), i.e. the same format both real services
+produce for this app, so the bytes written to disk match real-world sizes.
+
+Usage:
+    python benchmarks/mock_upstream.py --port 8765 --latency-ms 150 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import html
+import json
+import logging
+import random
+import re
+import uuid
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger("mock_upstream")
+
+# One silent MPEG-2 Layer III frame: 24kHz, 48kbps, mono, 576 samples (24ms), 144 bytes
+MP3_FRAME = b"\xff\xf3\x64\xc0" + b"\x00" * 140
+MP3_FRAME_SECONDS = 576 / 24000
+
+EDGE_WS_PATH = "/consumer/speech/synthesize/readaloud/edge/v1"
+EDGE_VOICES_PATH = "/consumer/speech/synthesize/readaloud/voices/list"
+AZURE_TTS_PATH = "/cognitiveservices/v1"
+AZURE_VOICES_PATH = "/cognitiveservices/voices/list"
+
+VOICES = [
+    # (ShortName, Gender, LocalName, StyleList)
+    ("zh-CN-XiaoxiaoNeural", "Female", "晓晓", ["assistant", "chat", "cheerful", "sad"]),
+    ("zh-CN-YunxiNeural", "Male", "云希", ["narration-relaxed", "cheerful"]),
+    ("zh-CN-YunjianNeural", "Male", "云健", []),
+    ("zh-TW-HsiaoChenNeural", "Female", "曉臻", []),
+    ("en-US-JennyNeural", "Female", "Jenny", ["assistant", "chat", "newscast"]),
+    ("en-US-GuyNeural", "Male", "Guy", ["newscast"]),
+    ("ja-JP-NanamiNeural", "Female", "七海", ["chat", "cheerful"]),
+]
+
+
+def edge_voice_list():
+    voices = []
+    for short_name, gender, _, _ in VOICES:
+        locale = short_name.rsplit("-", 1)[0]
+        voices.append({
+            "Name": f"Microsoft Server Speech Text to Speech Voice ({locale}, {short_name.split('-')[-1]})",
+            "ShortName": short_name,
+            "Gender": gender,
+            "Locale": locale,
+            "SuggestedCodec": "audio-24khz-48kbitrate-mono-mp3",
+            "FriendlyName": f"Microsoft {short_name.split('-')[-1][:-6]} Online (Natural) - {locale}",
+            "Status": "GA",
+            "VoiceTag": {"ContentCategories": ["General"], "VoicePersonalities": ["Friendly"]},
+        })
+    return voices
+
+
+def azure_voice_list():
+    voices = []
+    for short_name, gender, local_name, styles in VOICES:
+        locale = short_name.rsplit("-", 1)[0]
+        voice = {
+            "Name": f"Microsoft Server Speech Text to Speech Voice ({locale}, {short_name.split('-')[-1]})",
+            "DisplayName": short_name.split("-")[-1][:-6],
+            "LocalName": local_name,
+            "ShortName": short_name,
+            "Gender": gender,
+            "Locale": locale,
+            "LocaleName": locale,
+            "SampleRateHertz": "24000",
+            "VoiceType": "Neural",
+            "Status": "GA",
+            "WordsPerMinute": "150",
+        }
+        if styles:
+            voice["StyleList"] = styles
+        voices.append(voice)
+    return voices
+
+
+def ssml_to_text(ssml):
+    """Extracts the spoken text from an SSML document."""
+    return html.unescape(re.sub(r"<[^>]+>", "", ssml)).strip()
+
+
+def parse_text_message(data):
+    """Splits an edge-tts text frame into (headers, body)."""
+    head, _, body = data.partition("\r\n\r\n")
+    headers = {}
+    for line in head.split("\r\n"):
+        key, sep, value = line.partition(":")
+        if sep:
+            headers[key] = value
+    return headers, body
+
+
+class UpstreamStats:
+    """Counters exposed on /__stats so benchmark runs can attribute upstream work."""
+
+    def __init__(self):
+        self.counters = {}
+
+    def incr(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        return dict(self.counters)
+
+
+class MockUpstream:
+    def __init__(self, latency_ms=100.0, jitter_ms=0.0, throughput_kbps=0.0,
+                 chars_per_second=15.0, error_rate=0.0, error_status=500, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throughput_kbps = throughput_kbps
+        self.chars_per_second = chars_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.stats = UpstreamStats()
+
+    # ---------- Shared behaviour ----------
+    async def first_byte_delay(self):
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+
+    def should_fail(self):
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def audio_for(self, text):
+        """Returns silent MP3 audio whose duration scales with the text length."""
+        seconds = max(len(text), 1) / self.chars_per_second
+        frames = max(1, int(seconds / MP3_FRAME_SECONDS))
+        return MP3_FRAME * frames
+
+    def chunk_delay(self, chunk_size):
+        if self.throughput_kbps <= 0:
+            return 0
+        return chunk_size / (self.throughput_kbps * 1000 / 8)
+
+    # ---------- Edge ----------
+    async def edge_voices(self, request):
+        self.stats.incr("edge_voices")
+        await self.first_byte_delay()
+        return web.json_response(edge_voice_list())
+
+    async def edge_websocket(self, request):
+        ws = web.WebSocketResponse(compress=False)
+        await ws.prepare(request)
+        self.stats.incr("edge_connections")
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            headers, body = parse_text_message(msg.data)
+            if headers.get("Path") != "ssml":
+                continue  # speech.config and anything else needs no reply
+            request_id = headers.get("X-RequestId", uuid.uuid4().hex)
+            text = ssml_to_text(body)
+            self.stats.incr("edge_synthesize")
+            self.stats.incr("edge_chars", len(text))
+            await self.first_byte_delay()
+            await ws.send_str(self._edge_text_frame(request_id, "turn.start", {"context": {"serviceTag": "mock"}}))
+            if self.should_fail():
+                # Drop the connection mid-turn, like a throttled or broken upstream
+                self.stats.incr("edge_errors")
+                await ws.close()
+                return ws
+            audio = self.audio_for(text)
+            chunk_size = len(MP3_FRAME) * 32
+            for start in range(0, len(audio), chunk_size):
+                chunk = audio[start:start + chunk_size]
+                await ws.send_bytes(self._edge_audio_frame(request_id, chunk))
+                delay = self.chunk_delay(len(chunk))
+                if delay:
+                    await asyncio.sleep(delay)
+            self.stats.incr("edge_audio_bytes", len(audio))
+            await ws.send_str(self._edge_text_frame(request_id, "turn.end", {}))
+        return ws
+
+    @staticmethod
+    def _edge_text_frame(request_id, path, payload):
+        return (f"X-RequestId:{request_id}\r\n"
+                f"Content-Type:application/json; charset=utf-8\r\n"
+                f"Path:{path}\r\n\r\n{json.dumps(payload)}")
+
+    @staticmethod
+    def _edge_audio_frame(request_id, data):
+        header = (f"X-RequestId:{request_id}\r\n"
+                  f"Content-Type:audio/mpeg\r\n"
+                  f"Path:audio").encode("utf-8")
+        return len(header).to_bytes(2, "big") + header + b"\r\n" + data
+
+    # ---------- Azure ----------
+    async def azure_voices(self, request):
+        self.stats.incr("azure_voices")
+        if not request.headers.get("Ocp-Apim-Subscription-Key"):
+            return web.json_response({"error": {"code": "401", "message": "Access denied"}}, status=401)
+        await self.first_byte_delay()
+        return web.json_response(azure_voice_list())
+
+    async def azure_synthesize(self, request):
+        self.stats.incr("azure_synthesize")
+        if not request.headers.get("Ocp-Apim-Subscription-Key"):
+            return web.json_response({"error": {"code": "401", "message": "Access denied"}}, status=401)
+        ssml = await request.text()
+        text = ssml_to_text(ssml)
+        self.stats.incr("azure_chars", len(text))
+        await self.first_byte_delay()
+        if self.should_fail():
+            self.stats.incr("azure_errors")
+            return web.json_response(
+                {"error": {"code": str(self.error_status), "message": "Injected upstream failure"}},
+                status=self.error_status)
+
+        audio = self.audio_for(text)
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        response.content_length = len(audio)
+        await response.prepare(request)
+        chunk_size = 16 * 1024
+        for start in range(0, len(audio), chunk_size):
+            chunk = audio[start:start + chunk_size]
+            await response.write(chunk)
+            delay = self.chunk_delay(len(chunk))
+            if delay:
+                await asyncio.sleep(delay)
+        await response.write_eof()
+        self.stats.incr("azure_audio_bytes", len(audio))
+        return response
+
+    # ---------- Introspection ----------
+    async def get_stats(self, request):
+        return web.json_response(self.stats.snapshot())
+
+    def make_app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get(EDGE_WS_PATH, self.edge_websocket)
+        app.router.add_get(EDGE_VOICES_PATH, self.edge_voices)
+        app.router.add_get(AZURE_VOICES_PATH, self.azure_voices)
+        app.router.add_post(AZURE_TTS_PATH, self.azure_synthesize)
+        app.router.add_get("/__stats", self.get_stats)
+        return app
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock edge-tts / Azure TTS upstream for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Time to first byte per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter applied to latency")
+    parser.add_argument("--throughput-kbps", type=float, default=0.0,
+                        help="Audio streaming rate in kbit/s (0 = unlimited)")
+    parser.add_argument("--chars-per-second", type=float, default=15.0,
+                        help="Speaking rate used to size the returned audio")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of synthesis requests to fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status for injected Azure errors")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for jitter/error injection")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    upstream = MockUpstream(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        throughput_kbps=args.throughput_kbps,
+        chars_per_second=args.chars_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    logger.info(f"Mock upstream listening on http://{args.host}:{args.port} "
+                f"(latency={args.latency_ms}ms, throughput={args.throughput_kbps or 'unlimited'}kbps, "
+                f"error_rate={args.error_rate})")
+    web.run_app(upstream.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+"""
+Reproducible benchmark suite for the TTS backend.
+
+Starts benchmarks/mock_upstream.py and backend/app.py as subprocesses (the app is
+pointed at the mock through its AZURE_TTS_ENDPOINT / EDGE_TTS_* settings), drives
+the HTTP API at varying concurrency and text length, and writes one JSON document
+with throughput, latency percentiles, CPU, RSS and temp-disk usage per run.
+
+Usage:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/run_bench.py --concurrency 1,4,16 --text-lengths 50,500,5000 \
+        --output bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+import requests
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+APP_PATH = os.path.join(ROOT_DIR, 'backend', 'app.py')
+MOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_upstream.py')
+
+BENCH_API_KEY = 'bench-key'
+SAMPLE_TEXT = "这是一段用于性能基准测试的示例文本。The quick brown fox jumps over the lazy dog. "
+
+
+def make_text(length, variant=None):
+    """Builds deterministic text of exactly `length` characters.
+
+    Distinct `variant`s give distinct texts, which keeps requests out of the Azure audio cache.
+    """
+    prefix = f"{variant}. " if variant is not None else ""
+    repeats = length // len(SAMPLE_TEXT) + 1
+    return (prefix + SAMPLE_TEXT * repeats)[:length]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_http(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def dir_bytes(path):
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        total += entry.stat().st_size
+                except OSError:
+                    pass  # File removed while scanning
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def clear_dir(path):
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        try:
+            os.remove(os.path.join(path, name))
+        except OSError:
+            pass
+
+
+class ResourceSampler:
+    """Samples RSS of the app process and bytes in its audio directory in the background."""
+
+    def __init__(self, pid, audio_dir, interval=0.1):
+        self.process = psutil.Process(pid)
+        self.audio_dir = audio_dir
+        self.interval = interval
+        self.rss_peak = 0
+        self.disk_peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _cpu_seconds(self):
+        times = self.process.cpu_times()
+        return times.user + times.system
+
+    def _sample(self):
+        self.rss_peak = max(self.rss_peak, self.process.memory_info().rss)
+        self.disk_peak = max(self.disk_peak, dir_bytes(self.audio_dir))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except psutil.Error:
+                return
+
+    def __enter__(self):
+        self.cpu_start = self._cpu_seconds()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        self.cpu_seconds = self._cpu_seconds() - self.cpu_start
+        self.rss_end = self.process.memory_info().rss
+        self.disk_end = dir_bytes(self.audio_dir)
+        return False
+
+
+# ----------------------------------------------------
+# Scenarios
+# ----------------------------------------------------
+# Each scenario is (setup, request, depends_on_text_length). setup(session, base_url,
+# text_length) runs once before a batch and returns a context object; request(session,
+# base_url, text_length, index, context) issues one HTTP request and returns the Response.
+
+def _no_setup(session, base_url, text_length):
+    return None
+
+
+def edge_synthesize(session, base_url, text_length, index, ctx):
+    return session.post(f"{base_url}/api/edge/synthesize", json={
+        "text": make_text(text_length),
+        "voice": "zh-CN-XiaoxiaoNeural",
+        "format": "mp3",
+    }, timeout=120)
+
+
+def azure_setup(session, base_url, text_length):
+    # Tag texts per batch so earlier batches never warm the cache for later ones
+    return uuid.uuid4().hex[:8]
+
+
+def azure_synthesize(session, base_url, text_length, index, ctx):
+    return session.post(f"{base_url}/api/azure/synthesize", json={
+        "text": make_text(text_length, variant=f"{ctx}-{index}"),
+        "voice": "zh-CN-XiaoxiaoNeural",
+        "region": "eastus",
+    }, headers={'Ocp-Apim-Subscription-Key': BENCH_API_KEY}, timeout=120)
+
+
+def azure_cached_setup(session, base_url, text_length):
+    response = azure_synthesize(session, base_url, text_length, 0, "cached")
+    response.raise_for_status()
+    return "cached"
+
+
+def azure_synthesize_cached(session, base_url, text_length, index, ctx):
+    return azure_synthesize(session, base_url, text_length, 0, ctx)
+
+
+def audio_setup(session, base_url, text_length):
+    response = edge_synthesize(session, base_url, text_length, 0, None)
+    response.raise_for_status()
+    return response.json()["audioUrl"]
+
+
+def audio_fetch(session, base_url, text_length, index, audio_url):
+    return session.get(f"{base_url}{audio_url}", timeout=60)
+
+
+def edge_bootstrap(session, base_url, text_length, index, ctx):
+    return session.get(f"{base_url}/api/edge/bootstrap", headers={'Accept-Encoding': 'br, gzip'}, timeout=30)
+
+
+def _preset_scenario(engine, payload):
+    """Mixed save / list / load traffic against one engine's preset routes."""
+    url_path = f"/api/{engine}/presets"
+
+    def setup(session, base_url, text_length):
+        session.post(f"{base_url}{url_path}", json=dict(payload, name="bench_seed"), timeout=30).raise_for_status()
+        return "bench_seed"
+
+    def request(session, base_url, text_length, index, seed_name):
+        url = f"{base_url}{url_path}"
+        op = index % 3
+        if op == 0:
+            return session.post(url, json=dict(payload, name=f"bench_{index}"), timeout=30)
+        if op == 1:
+            return session.get(url, timeout=30)
+        return session.get(url, params={"name": seed_name}, timeout=30)
+    return setup, request
+
+
+SCENARIOS = {
+    # name: (setup, request, depends_on_text_length)
+    "edge_synthesize": (_no_setup, edge_synthesize, True),
+    "azure_synthesize": (azure_setup, azure_synthesize, True),
+    "azure_synthesize_cached": (azure_cached_setup, azure_synthesize_cached, True),
+    "audio_fetch": (audio_setup, audio_fetch, True),
+    "edge_bootstrap": (_no_setup, edge_bootstrap, False),
+    "edge_presets": _preset_scenario("edge", {
+        "voice": "zh-CN-XiaoxiaoNeural", "rate": 10, "volume": 0, "pitch": 0}) + (False,),
+    "azure_presets": _preset_scenario("azure", {
+        "voice": "zh-CN-XiaoxiaoNeural", "style": "cheerful", "rate": 0, "pitch": 0, "volume": 0}) + (False,),
+}
+
+
+def run_batch(base_url, scenario, concurrency, text_length, total_requests):
+    setup, request_fn, _ = SCENARIOS[scenario]
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    ctx = setup(requests.Session(), base_url, text_length)
+    latencies = []
+    status_counts = {}
+    lock = threading.Lock()
+
+    def one(index):
+        start = time.perf_counter()
+        try:
+            status = request_fn(session(), base_url, text_length, index, ctx).status_code
+        except requests.exceptions.RequestException:
+            status = 'error'
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    duration = time.perf_counter() - started
+
+    ok = sum(n for status, n in status_counts.items() if status.startswith('2'))
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    return {
+        "requests": total_requests,
+        "ok": ok,
+        "errors": total_requests - ok,
+        "status_counts": status_counts,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(ok / duration, 3) if duration else None,
+        "latency_ms": {
+            "mean": round(sum(ms) / len(ms), 2) if ms else None,
+            "p50": round(percentile(ms, 50), 2) if ms else None,
+            "p95": round(percentile(ms, 95), 2) if ms else None,
+            "p99": round(percentile(ms, 99), 2) if ms else None,
+            "max": round(ms[-1], 2) if ms else None,
+        },
+    }
+
+
+def mock_stats(mock_url):
+    try:
+        return requests.get(f"{mock_url}/__stats", timeout=5).json()
+    except requests.exceptions.RequestException:
+        return {}
+
+
+def stats_delta(before, after):
+    return {k: after[k] - before.get(k, 0) for k in after if after[k] != before.get(k, 0)}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the TTS backend against a local mock upstream")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--text-lengths', default='50,500,5000', help="Comma-separated text lengths (chars)")
+    parser.add_argument('--requests', type=int, default=32, help="Requests per scenario/concurrency/length")
+    parser.add_argument('--output', default='bench_results.json', help="Where to write the JSON results")
+    parser.add_argument('--app-env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Extra environment variables for the app process (repeatable)")
+    # Mock upstream knobs (passed through to mock_upstream.py)
+    parser.add_argument('--latency-ms', type=float, default=100.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--throughput-kbps', type=float, default=0.0)
+    parser.add_argument('--chars-per-second', type=float, default=15.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1234)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}")
+    concurrency_levels = [int(c) for c in args.concurrency.split(',')]
+    text_lengths = [int(n) for n in args.text_lengths.split(',')]
+
+    run_dir = tempfile.mkdtemp(prefix='tts_bench_')
+    tmp_dir = os.path.join(run_dir, 'tmp')
+    presets_dir = os.path.join(run_dir, 'presets')
+    os.makedirs(tmp_dir)
+    os.makedirs(presets_dir)
+    audio_dir = os.path.join(tmp_dir, 'edge_tts_audio')
+
+    mock_port, app_port = free_port(), free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    base_url = f"http://127.0.0.1:{app_port}"
+    mock_args = [
+        '--port', str(mock_port),
+        '--latency-ms', str(args.latency_ms),
+        '--jitter-ms', str(args.jitter_ms),
+        '--throughput-kbps', str(args.throughput_kbps),
+        '--chars-per-second', str(args.chars_per_second),
+        '--error-rate', str(args.error_rate),
+        '--error-status', str(args.error_status),
+        '--seed', str(args.seed),
+    ]
+
+    app_env = dict(os.environ)
+    app_env.update({
+        'PORT': str(app_port),
+        'TMPDIR': tmp_dir,
+        'TEMP': tmp_dir,
+        'TMP': tmp_dir,
+        'PRESETS_DIR': presets_dir,
+        'USAGE_DB': os.path.join(run_dir, 'usage.db'),
+        'SYNTH_RATE_LIMIT': '1000000',
+        'VOICES_RATE_LIMIT': '1000000',
+        'AZURE_TTS_ENDPOINT': mock_url,
+        'EDGE_TTS_WSS_URL': f"ws://127.0.0.1:{mock_port}/consumer/speech/synthesize/readaloud/edge/v1"
+                            f"?TrustedClientToken=bench",
+        'EDGE_TTS_VOICE_LIST_URL': f"{mock_url}/consumer/speech/synthesize/readaloud/voices/list"
+                                   f"?trustedclienttoken=bench",
+    })
+    for item in args.app_env:
+        key, _, value = item.partition('=')
+        app_env[key] = value
+
+    mock_log = open(os.path.join(run_dir, 'mock_upstream.log'), 'w')
+    app_log = open(os.path.join(run_dir, 'app_stdout.log'), 'w')
+    mock_proc = subprocess.Popen([sys.executable, MOCK_PATH] + mock_args,
+                                 stdout=mock_log, stderr=subprocess.STDOUT)
+    app_proc = None
+    results = []
+    try:
+        wait_for_http(f"{mock_url}/__stats")
+        app_proc = subprocess.Popen([sys.executable, APP_PATH], cwd=run_dir, env=app_env,
+                                    stdout=app_log, stderr=subprocess.STDOUT)
+        wait_for_http(f"{base_url}/api/edge/presets")
+
+        for scenario in scenarios:
+            lengths = text_lengths if SCENARIOS[scenario][2] else [None]
+            for text_length in lengths:
+                for concurrency in concurrency_levels:
+                    clear_dir(audio_dir)
+                    clear_dir(presets_dir)
+                    upstream_before = mock_stats(mock_url)
+                    print(f"[bench] {scenario} concurrency={concurrency} text_length={text_length}", flush=True)
+                    with ResourceSampler(app_proc.pid, audio_dir) as sampler:
+                        batch = run_batch(base_url, scenario, concurrency, text_length or 0, args.requests)
+                    batch.update({
+                        "scenario": scenario,
+                        "concurrency": concurrency,
+                        "text_length": text_length,
+                        "cpu_seconds": round(sampler.cpu_seconds, 4),
+                        "cpu_percent": round(100 * sampler.cpu_seconds / batch["duration_s"], 2)
+                        if batch["duration_s"] else None,
+                        "rss_peak_bytes": sampler.rss_peak,
+                        "rss_end_bytes": sampler.rss_end,
+                        "temp_disk_bytes_peak": sampler.disk_peak,
+                        "temp_disk_bytes_end": sampler.disk_end,
+                        "upstream": stats_delta(upstream_before, mock_stats(mock_url)),
+                    })
+                    results.append(batch)
+                    print(f"[bench]   {batch['throughput_rps']} req/s, "
+                          f"p50={batch['latency_ms']['p50']}ms p99={batch['latency_ms']['p99']}ms, "
+                          f"errors={batch['errors']}", flush=True)
+    finally:
+        for proc in (app_proc, mock_proc):
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        mock_log.close()
+        app_log.close()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "run_id": uuid.uuid4().hex,
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests_per_run": args.requests,
+            "mock": {
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "throughput_kbps": args.throughput_kbps,
+                "chars_per_second": args.chars_per_second,
+                "error_rate": args.error_rate,
+                "error_status": args.error_status,
+                "seed": args.seed,
+            },
+        },
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[bench] Wrote {len(results)} results to {args.output}")
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
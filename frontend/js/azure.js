@@ -7,6 +7,7 @@
 docReady(function() {
     // ---- Configuration ----
      const AZURE_API_BASE = '/api/azure'; // Base for Azure specific APIs
+    let maxChars = 50000; // Replaced by the server's limit once bootstrap data arrives
 
     // ---- DOM Element References ----
     const elements = {
@@ -178,7 +179,12 @@ docReady(function() {
         const count = elements.textInput.value.length;
         // Azure counts bytes for some limits, but char count is fine for UI feedback
         elements.charCounter.textContent = `${count} 字`;
-        // Add warning/error classes based on potential limits if needed
+        elements.charCounter.className = 'char-counter'; // Reset class
+        if (count > maxChars) {
+            elements.charCounter.classList.add('error');
+        } else if (count > maxChars * 0.9) {
+            elements.charCounter.classList.add('warning');
+        }
     }
 
      // Apply preset settings to UI (Callback for PresetManager)
@@ -229,6 +235,50 @@ docReady(function() {
         };
     }
 
+    // Populate the UI from an Azure voice list and apply any pending preset/saved voice
+    function applyAzureVoices(voices, region) {
+        azureVoices = voices; // Store the loaded voices
+
+        populateAzureVoiceList(azureVoices);
+
+        // Check if a preset was waiting for voices to load
+        const pendingVoice = elements.voiceSelect.dataset.pendingPresetVoice;
+        const pendingStyle = elements.voiceSelect.dataset.pendingPresetStyle;
+        if (pendingVoice) {
+             const voiceExists = azureVoices.some(v => v.ShortName === pendingVoice);
+             if (voiceExists) {
+                 elements.voiceSelect.value = pendingVoice;
+                 updateStyleOptions(pendingVoice);
+                 if (pendingStyle) elements.styleSelect.value = pendingStyle;
+                 showToast('success', '预设已应用', `之前加载的预设 "${elements.presetSelect.value}" 已应用。`);
+             } else {
+                 showToast('warning', '语音未找到', `之前加载的预设语音 "${pendingVoice}" 在此区域不可用。`);
+             }
+             // Clear pending flags
+             delete elements.voiceSelect.dataset.pendingPresetVoice;
+             delete elements.voiceSelect.dataset.pendingPresetStyle;
+        } else {
+             // Restore selection from localStorage if no preset pending
+             const settings = JSON.parse(localStorage.getItem('azureTtsSettings')) || {};
+             if (settings.voice && azureVoices.some(v => v.ShortName === settings.voice)) {
+                elements.voiceSelect.value = settings.voice;
+                updateStyleOptions(settings.voice);
+                if (settings.style) elements.styleSelect.value = settings.style;
+             } else if (azureVoices.length > 0) {
+                // Select first voice as default if none saved/restored
+                elements.voiceSelect.value = azureVoices[0].ShortName;
+                 updateStyleOptions(azureVoices[0].ShortName);
+             }
+        }
+
+
+         if (elements.voiceStatus) {
+            elements.voiceStatus.className = 'status-indicator ready';
+            elements.voiceStatus.innerHTML = `<i class="fas fa-check-circle"></i> 已加载 ${azureVoices.length} 个语音 (${region})`;
+         }
+         showToast('success', '语音加载成功', `从区域 ${region} 加载了 ${azureVoices.length} 个语音。`);
+    }
+
     // Fetch Azure voices
     async function loadAzureVoices() {
         const apiKey = elements.apiKeyInput.value.trim();
@@ -250,7 +300,7 @@ docReady(function() {
         elements.styleSelect.disabled = true;
 
         try {
-            const response = await fetch(`${AZURE_API_BASE}/voices?region=${region}`, {
+            const response = await fetch(`${AZURE_API_BASE}/voices?region=${encodeURIComponent(region)}`, {
                 headers: { 'Ocp-Apim-Subscription-Key': apiKey }
             });
 
@@ -263,46 +313,7 @@ docReady(function() {
                 throw new Error(errorMsg);
             }
 
-            azureVoices = await response.json(); // Store the loaded voices
-
-            populateAzureVoiceList(azureVoices);
-
-            // Check if a preset was waiting for voices to load
-            const pendingVoice = elements.voiceSelect.dataset.pendingPresetVoice;
-            const pendingStyle = elements.voiceSelect.dataset.pendingPresetStyle;
-            if (pendingVoice) {
-                 const voiceExists = azureVoices.some(v => v.ShortName === pendingVoice);
-                 if (voiceExists) {
-                     elements.voiceSelect.value = pendingVoice;
-                     updateStyleOptions(pendingVoice);
-                     if (pendingStyle) elements.styleSelect.value = pendingStyle;
-                     showToast('success', '预设已应用', `之前加载的预设 "${elements.presetSelect.value}" 已应用。`);
-                 } else {
-                     showToast('warning', '语音未找到', `之前加载的预设语音 "${pendingVoice}" 在此区域不可用。`);
-                 }
-                 // Clear pending flags
-                 delete elements.voiceSelect.dataset.pendingPresetVoice;
-                 delete elements.voiceSelect.dataset.pendingPresetStyle;
-            } else {
-                 // Restore selection from localStorage if no preset pending
-                 const settings = JSON.parse(localStorage.getItem('azureTtsSettings')) || {};
-                 if (settings.voice && azureVoices.some(v => v.ShortName === settings.voice)) {
-                    elements.voiceSelect.value = settings.voice;
-                    updateStyleOptions(settings.voice);
-                    if (settings.style) elements.styleSelect.value = settings.style;
-                 } else if (azureVoices.length > 0) {
-                    // Select first voice as default if none saved/restored
-                    elements.voiceSelect.value = azureVoices[0].ShortName;
-                     updateStyleOptions(azureVoices[0].ShortName);
-                 }
-            }
-
-
-             if (elements.voiceStatus) {
-                elements.voiceStatus.className = 'status-indicator ready';
-                elements.voiceStatus.innerHTML = `<i class="fas fa-check-circle"></i> 已加载 ${azureVoices.length} 个语音 (${region})`;
-             }
-             showToast('success', '语音加载成功', `从区域 ${region} 加载了 ${azureVoices.length} 个语音。`);
+            applyAzureVoices(await response.json(), region);
 
         } catch (error) {
             console.error('加载 Azure 语音失败:', error);
@@ -318,6 +329,42 @@ docReady(function() {
         }
     }
 
+    // Load presets, server limits and (if a key is saved) voices in a single request on page load
+    async function loadBootstrap() {
+        const apiKey = elements.apiKeyInput.value.trim();
+        const region = elements.regionSelect.value;
+        const headers = apiKey ? { 'Ocp-Apim-Subscription-Key': apiKey } : {};
+
+        try {
+            const response = await fetch(`${AZURE_API_BASE}/bootstrap?region=${encodeURIComponent(region)}`, { headers });
+            if (!response.ok) {
+                const errorData = await response.json().catch(() => ({}));
+                throw new Error(errorData.error || `获取失败: ${response.status}`);
+            }
+            const data = await response.json();
+
+            if (data.limits && data.limits.maxTextLength) {
+                maxChars = data.limits.maxTextLength;
+                updateCharCounter();
+            }
+            presetManager.setPresets(data.presets || []);
+
+            if (data.voices) {
+                applyAzureVoices(data.voices, region);
+                elements.voiceSelect.disabled = false;
+            } else if (data.voicesError) {
+                throw new Error(data.voicesError);
+            }
+        } catch (error) {
+            console.error('加载 Azure 初始化数据失败:', error);
+            if (elements.voiceStatus) {
+                elements.voiceStatus.className = 'status-indicator error';
+                elements.voiceStatus.innerHTML = `<i class="fas fa-exclamation-circle"></i> 加载语音失败`;
+            }
+            showToast('error', '加载失败', `加载 Azure 初始化数据失败: ${error.message}`);
+        }
+    }
+
     // Populate Azure voice dropdown
     function populateAzureVoiceList(voices) {
         elements.voiceSelect.innerHTML = ''; // Clear
@@ -510,6 +557,9 @@ docReady(function() {
 
             showToast('success', '生成成功', '音频已生成并加载到播放器。');
             saveSettings(); // Save settings after successful generation
+            if (data.quotaWarning) {
+                showToast('warning', '用量提醒', data.quotaWarning);
+            }
 
 
         } catch (error) {
@@ -598,7 +648,8 @@ docReady(function() {
         console.log("Initializing Azure TTS Studio...");
         initEventListeners();
         loadSettings(); // Load saved settings
-        // Voices loaded manually via button click
+        // Presets and limits load now; voices too if a key was saved, otherwise via button click
+        loadBootstrap();
         updateSlidersDisplay(); // Set initial slider values display
         console.log("Azure Initialization complete.");
     }
@@ -125,8 +125,84 @@ class AudioPlayerController {
   }
 }
 
-/* ============  Very‑Lite PresetManager (占位)  ============ */
+/* ============  Lite PresetManager  ============ */
+// 预设列表（含完整参数）由页面的 bootstrap 接口一次性提供，加载预设无需再请求服务器
 class PresetManager {
-  constructor() { /* 先占位，避免 ReferenceError；日后再补全 */ }
+  constructor(cfg) {
+    this.cfg = cfg;
+    this.select = document.getElementById(cfg.presetSelectId);
+    this.nameInput = document.getElementById(cfg.presetNameInputId);
+    this.presets = [];
+
+    document.getElementById(cfg.loadPresetBtnId)?.addEventListener("click", () => this.loadSelected());
+    document.getElementById(cfg.savePresetBtnId)?.addEventListener("click", () => this.save());
+    document.getElementById(cfg.deletePresetBtnId)?.addEventListener("click", () => this.deleteSelected());
+  }
+
+  /* ---------- 公共方法 ---------- */
+  setPresets(presets = []) {
+    this.presets = [...presets].sort((a, b) => a.name.localeCompare(b.name));
+    if (!this.select) return;
+    const current = this.select.value;
+    this.select.innerHTML = '<option value="">选择预设...</option>';
+    this.presets.forEach(p => {
+      const option = document.createElement("option");
+      option.value = p.name;
+      option.textContent = p.name;
+      this.select.appendChild(option);
+    });
+    if (this.presets.some(p => p.name === current)) this.select.value = current;
+  }
+  async refresh() {
+    try {
+      const res = await fetch(this.cfg.apiEndpoint);
+      if (!res.ok) throw new Error(`${res.status}`);
+      this.setPresets(await res.json());
+    } catch (e) {
+      showToast("error", "加载预设失败", e.message);
+    }
+  }
+
+  /* ---------- 内部逻辑 ---------- */
+  loadSelected() {
+    const preset = this.presets.find(p => p.name === this.select?.value);
+    if (!preset) { showToast("warning", "未选择预设", "请先选择要加载的预设。"); return; }
+    this.cfg.applyPresetCallback?.(preset);
+    showToast("success", "预设已加载", preset.name);
+  }
+  async save() {
+    const name = this.nameInput?.value.trim();
+    if (!name) { showToast("warning", "名称为空", "请输入预设名称。"); return; }
+    const settings = this.cfg.getCurrentSettingsCallback?.() || {};
+    try {
+      const res = await fetch(this.cfg.apiEndpoint, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ...settings, name })
+      });
+      const data = await res.json().catch(() => ({}));
+      if (!res.ok) throw new Error(data.error || `${res.status}`);
+      // 服务器会规范化文件名，重新拉取列表以保持名称一致
+      await this.refresh();
+      if (this.select) this.select.value = this.presets.some(p => p.name === data.name) ? data.name : "";
+      if (this.nameInput) this.nameInput.value = "";
+      showToast("success", "预设已保存", name);
+    } catch (e) {
+      showToast("error", "保存预设失败", e.message);
+    }
+  }
+  async deleteSelected() {
+    const name = this.select?.value;
+    if (!name) { showToast("warning", "未选择预设", "请先选择要删除的预设。"); return; }
+    try {
+      const res = await fetch(`${this.cfg.apiEndpoint}?name=${encodeURIComponent(name)}`, { method: "DELETE" });
+      const data = await res.json().catch(() => ({}));
+      if (!res.ok) throw new Error(data.error || `${res.status}`);
+      this.setPresets(this.presets.filter(p => p.name !== name));
+      showToast("success", "预设已删除", name);
+    } catch (e) {
+      showToast("error", "删除预设失败", e.message);
+    }
+  }
 }
 
@@ -6,7 +6,7 @@
 
 docReady(function() {
   // ---- Configuration ----
-  const MAX_CHARS = 50000;
+  let maxChars = 50000; // Replaced by the server's limit once bootstrap data arrives
   const EDGE_API_BASE = '/api/edge'; // Base for Edge specific APIs
 
   // ---- DOM Element References ----
@@ -168,11 +168,11 @@ docReady(function() {
   function updateCharCounter() {
       if (!elements.textInput || !elements.charCounter) return;
       const count = elements.textInput.value.length;
-      elements.charCounter.textContent = `${count}/${MAX_CHARS}`;
+      elements.charCounter.textContent = `${count}/${maxChars}`;
       elements.charCounter.className = 'char-counter'; // Reset class
-      if (count > MAX_CHARS) {
+      if (count > maxChars) {
           elements.charCounter.classList.add('error');
-      } else if (count > MAX_CHARS * 0.9) {
+      } else if (count > maxChars * 0.9) {
           elements.charCounter.classList.add('warning');
       }
   }
@@ -216,15 +216,55 @@ docReady(function() {
   }
 
 
-  // Fetch voices from backend
-  async function getVoices() {
-      if (!elements.btnGetVoices || !elements.voiceStatus || !elements.voiceSelect) return;
-
-      updateButtonState(elements.btnGetVoices, true, '加载中...'); // Use common helper
+  // Show the voice list loading state
+  function setVoicesLoading() {
       elements.voiceStatus.className = 'status-indicator loading';
       elements.voiceStatus.innerHTML = '<span class="pulse"></span> 正在获取语音列表...';
       elements.voiceSelect.innerHTML = '<option value="">加载中...</option>';
       elements.voiceSelect.disabled = true;
+  }
+
+  // Show a voice list loading failure
+  function setVoicesError(error) {
+      console.error('获取语音列表失败:', error);
+      elements.voiceStatus.className = 'status-indicator error';
+      elements.voiceStatus.innerHTML = `<i class="fas fa-exclamation-circle"></i> 获取语音列表失败`;
+      showToast('error', '加载错误', `获取语音列表失败: ${error.message}`);
+      elements.voiceSelect.innerHTML = '<option value="">加载失败</option>';
+  }
+
+  // Populate the UI from a voice catalog ({ chinese_voices, other_voices })
+  function applyVoiceData(data) {
+      if (!data || !Array.isArray(data.chinese_voices)) {
+          throw new Error('返回数据格式不正确');
+      }
+
+      allVoices.chinese = data.chinese_voices || [];
+      allVoices.other = data.other_voices || [];
+
+      populateVoiceList(allVoices.chinese, allVoices.other); // Populate dropdown
+
+      // Restore selection after populating
+      const settings = JSON.parse(localStorage.getItem('edgeTtsSettings')) || {};
+      if (settings.voice && elements.voiceSelect.querySelector(`option[value="${settings.voice}"]`)) {
+          elements.voiceSelect.value = settings.voice;
+      } else if (allVoices.chinese.length > 0) {
+           // Select the first Chinese voice if no setting found
+           elements.voiceSelect.value = allVoices.chinese[0].ShortName;
+      }
+
+
+      elements.voiceStatus.className = 'status-indicator ready'; // Use 'ready' class
+      elements.voiceStatus.innerHTML = `<i class="fas fa-check-circle"></i> 已加载 ${allVoices.chinese.length + allVoices.other.length} 个语音`;
+      showToast('success', '语音加载成功', `共找到 ${allVoices.chinese.length + allVoices.other.length} 个语音模型`);
+  }
+
+  // Fetch voices from backend (manual refresh)
+  async function getVoices() {
+      if (!elements.btnGetVoices || !elements.voiceStatus || !elements.voiceSelect) return;
+
+      updateButtonState(elements.btnGetVoices, true, '加载中...'); // Use common helper
+      setVoicesLoading();
 
       try {
           const response = await fetch(`${EDGE_API_BASE}/voices`);
@@ -232,39 +272,41 @@ docReady(function() {
                const errorData = await response.json().catch(() => ({}));
                throw new Error(errorData.error || `获取失败: ${response.status}`);
           }
-          const data = await response.json();
-
-          if (!data || !Array.isArray(data.chinese_voices)) {
-              throw new Error('返回数据格式不正确');
-          }
-
-          allVoices.chinese = data.chinese_voices || [];
-          allVoices.other = data.other_voices || [];
+          applyVoiceData(await response.json());
+      } catch (error) {
+          setVoicesError(error);
+      } finally {
+          updateButtonState(elements.btnGetVoices, false); // Use common helper
+          elements.voiceSelect.disabled = false;
+      }
+  }
 
-          populateVoiceList(allVoices.chinese, allVoices.other); // Populate dropdown
+  // Load voices, presets and server limits in a single request on page load
+  async function loadBootstrap() {
+      if (!elements.voiceStatus || !elements.voiceSelect) return;
+      setVoicesLoading();
 
-          // Restore selection after populating
-          const settings = JSON.parse(localStorage.getItem('edgeTtsSettings')) || {};
-          if (settings.voice && elements.voiceSelect.querySelector(`option[value="${settings.voice}"]`)) {
-              elements.voiceSelect.value = settings.voice;
-          } else if (allVoices.chinese.length > 0) {
-               // Select the first Chinese voice if no setting found
-               elements.voiceSelect.value = allVoices.chinese[0].ShortName;
+      try {
+          const response = await fetch(`${EDGE_API_BASE}/bootstrap`);
+          if (!response.ok) {
+               const errorData = await response.json().catch(() => ({}));
+               throw new Error(errorData.error || `获取失败: ${response.status}`);
           }
+          const data = await response.json();
 
-
-          elements.voiceStatus.className = 'status-indicator ready'; // Use 'ready' class
-          elements.voiceStatus.innerHTML = `<i class="fas fa-check-circle"></i> 已加载 ${allVoices.chinese.length + allVoices.other.length} 个语音`;
-          showToast('success', '语音加载成功', `共找到 ${allVoices.chinese.length + allVoices.other.length} 个语音模型`);
-
+          if (data.limits && data.limits.maxTextLength) {
+              maxChars = data.limits.maxTextLength;
+              if (elements.textInput) elements.textInput.maxLength = maxChars;
+              updateCharCounter();
+          }
+          presetManager.setPresets(data.presets || []);
+          if (!data.voices) {
+              throw new Error(data.voicesError || '返回数据格式不正确');
+          }
+          applyVoiceData(data.voices);
       } catch (error) {
-          console.error('获取语音列表失败:', error);
-          elements.voiceStatus.className = 'status-indicator error';
-          elements.voiceStatus.innerHTML = `<i class="fas fa-exclamation-circle"></i> 获取语音列表失败`;
-          showToast('error', '加载错误', `获取语音列表失败: ${error.message}`);
-          elements.voiceSelect.innerHTML = '<option value="">加载失败</option>';
+          setVoicesError(error);
       } finally {
-          updateButtonState(elements.btnGetVoices, false); // Use common helper
           elements.voiceSelect.disabled = false;
       }
   }
@@ -370,8 +412,8 @@ docReady(function() {
           showToast('warning', '请输入文本', '合成内容不能为空。');
           return;
       }
-      if (text.length > MAX_CHARS) {
-          showToast('error', '文本过长', `文本超过最大长度 ${MAX_CHARS} 字符。`);
+      if (text.length > maxChars) {
+          showToast('error', '文本过长', `文本超过最大长度 ${maxChars} 字符。`);
           return;
       }
 
@@ -476,7 +518,7 @@ docReady(function() {
       console.log("Initializing Edge TTS Studio...");
       initEventListeners();
       loadSettings(); // Load saved settings first
-      getVoices(); // Then fetch voices (will try to restore selection)
+      loadBootstrap(); // Then fetch voices, presets and limits (will try to restore selection)
       console.log("Initialization complete.");
   }
 